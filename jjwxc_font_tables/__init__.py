@@ -16,14 +16,38 @@ def create_app(test_config=None):
         SECRET_KEY=str(uuid4()),
         SQLALCHEMY_DATABASE_URI='sqlite:///{}'.format(os.path.join(app.instance_path, 'jjwxc.sqlite')),
         COORD_TABLE_PATH=os.path.join(app.instance_path, 'coorTable.json'),
+        COORD_TABLE_BIN_PATH=os.path.join(app.instance_path, 'coorTable.bin'),
+        COORD_TABLE_JOURNAL_PATH=os.path.join(app.instance_path, 'coorTable.journal'),
+        COORD_TABLE_JOURNAL_COMPACT_SIZE=int(os.getenv('COORD_TABLE_JOURNAL_COMPACT_SIZE', 1 << 20)),
         SOURCE_HAN_SANS_SC_NORMAL_PATH=os.path.join(app.root_path, 'font_parser/assets/SourceHanSansSC-Normal.otf'),
         SOURCE_HAN_SANS_SC_REGULAR_PATH=os.path.join(app.root_path, 'font_parser/assets/SourceHanSansSC-Regular.otf'),
         ENABLE_TOOLS=os.getenv('ENABLE_TOOLS', False) and True,
-        SOURCE_HAN_SANS_SC_NORMAL_NPZ_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Normal.npz'),
-        SOURCE_HAN_SANS_SC_REGULARL_NPZ_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Regular.npz'),
-        SOURCE_HAN_SANS_SC_NORMAL_JSON_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Normal.json'),
-        SOURCE_HAN_SANS_SC_REGULARL_JSON_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Regular.json'),
-        CACHE_DIR=os.path.join(app.instance_path, 'cache-dir')
+        SOURCE_HAN_SANS_SC_NORMAL_BIN_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Normal.bin'),
+        SOURCE_HAN_SANS_SC_REGULARL_BIN_PATH=os.path.join(app.instance_path, 'SourceHanSansSC-Regular.bin'),
+        CACHE_DIR=os.path.join(app.instance_path, 'cache-dir'),
+        # 每个字体至多缓存 4 个响应，默认约可缓存 5000 个字体；超出时 FileSystemCache 需扫描整个缓存目录清理
+        CACHE_THRESHOLD=int(os.getenv('CACHE_THRESHOLD', 20000)),
+        FONT_LOCK_DIR=os.path.join(app.instance_path, 'locks'),
+        FONT_LOCK_STRIPES=int(os.getenv('FONT_LOCK_STRIPES', 1024)),
+        SLOW_MATCH_WORKERS=int(os.getenv('SLOW_MATCH_WORKERS', 1)),
+        STD_CACHE_REBUILD_WORKERS=int(os.getenv('STD_CACHE_REBUILD_WORKERS', os.cpu_count() or 1)),
+        HTTP_MAX_CONNECTIONS=int(os.getenv('HTTP_MAX_CONNECTIONS', 20)),
+        HTTP_MAX_KEEPALIVE_CONNECTIONS=int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 10)),
+        HTTP_KEEPALIVE_EXPIRY=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60)),
+        FONT_REQUEST_MAX_ATTEMPTS=int(os.getenv('FONT_REQUEST_MAX_ATTEMPTS', 5)),
+        FONT_REQUEST_BASE_DELAY=float(os.getenv('FONT_REQUEST_BASE_DELAY', 0.5)),
+        FONT_REQUEST_BACKOFF_MULTIPLIER=float(os.getenv('FONT_REQUEST_BACKOFF_MULTIPLIER', 2)),
+        FONT_REQUEST_MAX_DELAY=float(os.getenv('FONT_REQUEST_MAX_DELAY', 8)),
+        FONT_REQUEST_JITTER=float(os.getenv('FONT_REQUEST_JITTER', 0.5)),
+        FONT_REQUEST_DEADLINE=float(os.getenv('FONT_REQUEST_DEADLINE', 15)),
+        FONT_REQUEST_TIMEOUT=float(os.getenv('FONT_REQUEST_TIMEOUT', 5)),
+        FONT_REQUEST_RETRY_STATUSES={
+            int(x) for x in os.getenv('FONT_REQUEST_RETRY_STATUSES', '408,425,429,500,502,503,504').split(',')
+        },
+        FONT_REQUEST_BREAKER_THRESHOLD=int(os.getenv('FONT_REQUEST_BREAKER_THRESHOLD', 5)),
+        FONT_REQUEST_BREAKER_RESET_TIMEOUT=float(os.getenv('FONT_REQUEST_BREAKER_RESET_TIMEOUT', 30)),
+        API_BATCH_MAX_FONTS=int(os.getenv('API_BATCH_MAX_FONTS', 50)),
+        API_BATCH_CONCURRENCY=int(os.getenv('API_BATCH_CONCURRENCY', 4))
     )
     app.logger.info('ENABLE_TOOLS: {}'.format(app.config.get('ENABLE_TOOLS')))
 
@@ -72,14 +96,12 @@ def merge_and_deduplicate_coor_table(app: Flask):
             ]
         ] = sorted(_remote_coorTable, key=lambda x: x[0])
 
-    from .lib import merge_coor_table, deduplicate_coor_table
+    from .lib import merge_coor_table, deduplicate_coor_table, dump_coor_table
     new_local_coor_table = merge_coor_table(remote_coor_able, local_coor_table)
     new_local_coor_table = deduplicate_coor_table(new_local_coor_table)
 
     if len(new_local_coor_table) != len(local_coor_table):
-        if len(new_local_coor_table) != len(local_coor_table):
-            with open(app.config.get('COORD_TABLE_PATH'), 'w') as f:
-                json.dump(new_local_coor_table, f)
+        dump_coor_table(app.config.get('COORD_TABLE_PATH'), new_local_coor_table)
 
 
 def init(app: Flask):
@@ -94,14 +116,19 @@ def init(app: Flask):
     if not os.path.exists(app.config.get('CACHE_DIR')):
         os.makedirs(app.config.get('CACHE_DIR'))
 
+    if app.config.get('FONT_LOCK_DIR') and not os.path.exists(app.config.get('FONT_LOCK_DIR')):
+        os.makedirs(app.config.get('FONT_LOCK_DIR'))
+
     from .cache import cache
     cache.init_app(app, config={"CACHE_TYPE": "FileSystemCache", "CACHE_DIR": app.config.get('CACHE_DIR'),
-                                "CACHE_DEFAULT_TIMEOUT": 86400})
+                                "CACHE_DEFAULT_TIMEOUT": 86400,
+                                "CACHE_THRESHOLD": app.config.get('CACHE_THRESHOLD')})
 
     if not os.path.exists(os.path.join(app.instance_path, 'jjwxc.sqlite')):
         db.init_db()
 
-    # 复制/合并 coorTable.json
+    # 复制/合并 coorTable.json ，学习日志保留至合并完成
+    from .lib import compact_jjwxc_std_font_coord_table
     if not os.path.exists(app.config.get('COORD_TABLE_PATH')):
         shutil.copy(
             os.path.join(app.root_path, 'font_parser/assets/coorTable.json'),
@@ -115,6 +142,7 @@ def init(app: Flask):
                 os.path.join(app.root_path, 'font_parser/assets/coorTable.json'),
                 app.config.get('COORD_TABLE_PATH')
             )
+    compact_jjwxc_std_font_coord_table()
 
     @app.before_request
     def before_request():
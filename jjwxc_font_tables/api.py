@@ -1,30 +1,68 @@
-from flask import Blueprint, Response, jsonify, abort
+from flask import Blueprint, Response, jsonify, abort, current_app, request
 
-from .cache import cache
-from .font_parser import match_jjwxc_font
+from .cache import cached_font_response
+from .font_parser import match_jjwxc_font, match_jjwxc_font_tables
 from .lib import add_etag
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 
-def add_cors_and_cache_headers(response: Response):
+def add_cors_and_cache_headers(response: Response, methods: str = 'GET, HEAD, OPTIONS'):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
+    response.headers.add('Access-Control-Allow-Methods', methods)
     response.headers.add('Access-Control-Expose-Headers',
                          'Etag, Content-Length, Accept-Ranges, Content-Range')
     response.headers.add('Access-Control-Max-Age', '86400')
-    response.headers.add('Cache-Control', 'max-age=2678400')
+    if 'Cache-Control' not in response.headers:
+        response.headers.add('Cache-Control', 'max-age=2678400')
     return response
 
 
 @bp.after_request
 def api_after_request(response: Response):
-    add_cors_and_cache_headers(response)
+    if request.endpoint == 'api.get_tables':
+        add_cors_and_cache_headers(response, 'GET, HEAD, POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+    else:
+        add_cors_and_cache_headers(response)
+    return response
+
+
+def get_font_names() -> list[str]:
+    """
+    读取批量查询的字体名称，GET 为逗号分隔的 fonts 参数，
+    POST 为字体名称 JSON 数组或 {"fonts": [...]} 。
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('fonts')
+        if not isinstance(data, list) or not all(isinstance(x, str) for x in data):
+            abort(400)
+        font_names = data
+    else:
+        font_names = request.args.get('fonts', '').split(',')
+
+    return list(dict.fromkeys(x.strip() for x in font_names if x.strip()))
+
+
+@bp.route('/tables', methods=['GET', 'POST'])
+async def get_tables():
+    font_names = get_font_names()
+    if len(font_names) == 0 or len(font_names) > current_app.config.get('API_BATCH_MAX_FONTS'):
+        return abort(400)
+
+    tables, errors = await match_jjwxc_font_tables(font_names, current_app.config.get('API_BATCH_CONCURRENCY'))
+    response = jsonify({"tables": tables, "errors": errors})
+    add_etag(response)
+    # 上游暂时不可用或解析出错时不缓存
+    if any(x not in (403, 404) for x in errors.values()):
+        response.headers.add('Cache-Control', 'no-store')
     return response
 
 
-@cache.cached
 @bp.route('/<font_name>')
+@cached_font_response
 async def get_font(font_name: str):
     font, status_code = await match_jjwxc_font(font_name)
     if status_code == 200:
@@ -37,8 +75,8 @@ async def get_font(font_name: str):
         return abort(status_code)
 
 
-@cache.cached
 @bp.route('/<font_name>/table')
+@cached_font_response
 async def get_table(font_name: str):
     font, status_code = await match_jjwxc_font(font_name)
     if status_code == 200:
@@ -49,8 +87,8 @@ async def get_table(font_name: str):
         return abort(status_code)
 
 
-@cache.cached
 @bp.route('/<font_name>/bytes')
+@cached_font_response
 async def get_bytes(font_name: str):
     font, status_code = await match_jjwxc_font(font_name)
     if status_code == 200:
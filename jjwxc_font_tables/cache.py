@@ -1,3 +1,31 @@
+import functools
+
+from flask import Response, request
 from flask_caching import Cache
 
 cache = Cache()
+
+
+def cached_font_response(view):
+    """
+    缓存字体视图的成功响应，键为视图名及字体名称。
+    缓存内容为响应体及视图设置的响应头（含 ETag），命中时无需查询数据库、序列化及计算 ETag 。
+    """
+
+    @functools.wraps(view)
+    async def wrapper(font_name: str):
+        key = '{}/{}'.format(request.endpoint, font_name)
+        cached = cache.get(key)
+        if cached is not None:
+            body, headers = cached
+            return Response(body, headers=headers)
+
+        response = await view(font_name)
+        if response.status_code == 200:
+            cache.set(key, (
+                response.get_data(),
+                [(k, v) for k, v in response.headers.items() if k != 'Content-Length']
+            ))
+        return response
+
+    return wrapper
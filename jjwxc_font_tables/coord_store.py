@@ -0,0 +1,107 @@
+# coord table 编译文件格式
+# 文件依次为：文件头、字符（uint32 码位）、各字符坐标起点（uint32，共 字符数 + 1 个）、坐标（int16，每点 x y），
+# 各部分按 8 字节对齐，整个文件以一个只读 mmap 映射。
+import os
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+MAGIC = b'JJCOORD\0'
+VERSION = 1
+ALIGNMENT = 8
+
+# magic, version, 字符数, 点数, 字符、坐标起点、坐标偏移, 源 coorTable.json 文件大小及修改时间
+HEADER = struct.Struct('<8sIIQ QQQ QQ')
+
+
+class CoordStoreHeader(NamedTuple):
+    magic: bytes
+    version: int
+    count: int
+    points: int
+    characters_offset: int
+    offsets_offset: int
+    coords_offset: int
+    source_size: int
+    source_mtime_ns: int
+
+
+class CoordStore(NamedTuple):
+    characters: list[str]
+    offsets: np.ndarray
+    coords: np.ndarray
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def compile_coord_table(coor_table: list) -> CoordStore:
+    """将 coord table 转换为字符、坐标起点及坐标数组，跳过字符不为单个字符的条目"""
+    coor_table = [x for x in coor_table if len(x[0]) == 1]
+    lengths = np.array([len(coor) for _, coor in coor_table], dtype=np.int64)
+    offsets = np.zeros(len(coor_table) + 1, dtype=np.uint32)
+    np.cumsum(lengths, out=offsets[1:])
+    coords = np.array(
+        [point for _, coor in coor_table for point in coor], dtype=np.int16
+    ).reshape(int(offsets[-1]), 2)
+    return CoordStore([character for character, _ in coor_table], offsets, coords)
+
+
+def write_coord_store(path: str, coor_table: list, source_stat: os.stat_result):
+    """写入 coord table 编译文件。source_stat 为读取 coord table 时源文件的状态"""
+    characters, offsets, coords = compile_coord_table(coor_table)
+    index = np.array([ord(x) for x in characters], dtype=np.uint32)
+
+    characters_offset = _align(HEADER.size)
+    offsets_offset = _align(characters_offset + index.nbytes)
+    coords_offset = _align(offsets_offset + offsets.nbytes)
+
+    header = CoordStoreHeader(
+        MAGIC, VERSION, len(characters), len(coords), characters_offset, offsets_offset, coords_offset,
+        source_stat.st_size, source_stat.st_mtime_ns
+    )
+
+    # 多个进程可能同时编译，各自使用临时文件
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(*header))
+        for offset, array in ((characters_offset, index), (offsets_offset, offsets), (coords_offset, coords)):
+            f.seek(offset)
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path: str) -> CoordStoreHeader:
+    """读取文件头，非 coord table 编译文件或版本不一致时抛出 ValueError"""
+    with open(path, 'rb') as f:
+        header = CoordStoreHeader(*HEADER.unpack(f.read(HEADER.size)))
+
+    if header.magic != MAGIC or header.version != VERSION:
+        raise ValueError('unsupported coord store: {}'.format(path))
+    return header
+
+
+def load_coord_store(path: str) -> CoordStore:
+    """以只读 mmap 方式打开 coord table 编译文件"""
+    header = read_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    index = np.frombuffer(buffer, dtype=np.uint32, count=header.count, offset=header.characters_offset)
+    offsets = np.frombuffer(buffer, dtype=np.uint32, count=header.count + 1, offset=header.offsets_offset)
+    coords = np.frombuffer(buffer, dtype=np.int16, count=header.points * 2, offset=header.coords_offset) \
+        .reshape(header.points, 2)
+
+    return CoordStore([chr(x) for x in index.tolist()], offsets, coords)
+
+
+def check_coord_store(path: str, source_path: str) -> bool:
+    """依据文件头判断编译文件是否对应当前 coorTable.json"""
+    try:
+        header = read_header(path)
+    except (OSError, ValueError, struct.error):
+        return False
+
+    source_stat = os.stat(source_path)
+    return (header.source_size, header.source_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns)
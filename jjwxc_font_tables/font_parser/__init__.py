@@ -1,23 +1,27 @@
-import io
-import json
-import os.path
+import asyncio
+import concurrent.futures
+import fcntl
+import os
 import re
-from copy import deepcopy
+import threading
+import time
+import zlib
 from typing import Union
 
+import click
 import sqlalchemy as sa
 import sqlalchemy.exc as sa_exc
-from flask import current_app, Flask
+from flask import current_app, g, Flask
+from flask.cli import AppGroup
 
 from . import commonly_used_character
 from . import download
-from . import exception
+from . import pool
 from . import quick
 from . import slow
+from . import store
 from ..db import db, Font
-from ..lib import (
-    load_jjwxc_std_font_coord_table, deduplicate_coor_table
-)
+from ..lib import learn_jjwxc_std_font_coord_table
 
 
 def validator(input_font_name: str) -> bool:
@@ -41,26 +45,21 @@ async def _match_jjwxc_font(font_name: str) -> \
 
         if quick_match_status != "OK":
             _ttf_coordTable = quick_match_status
-            for x in _ttf_coordTable:
-                if x not in table.keys():
-                    with io.BytesIO(font.get('bytes')) as font_fd:
-                        slow_table = slow.match_jjwxc_font_one_character(x, font_fd)
-                    table[x] = slow_table[x]
-
-                    # 更新本地 coor table
-                    local_coor_table = load_jjwxc_std_font_coord_table()
-                    new_local_coor_table = [*local_coor_table,
-                                            [slow_table[x],
-                                             quick.get_character_coor_table_from_font(x, font.get('ttf'))]]
-
-                    new_local_coor_table = deduplicate_coor_table(new_local_coor_table)
-                    with open(current_app.config.get('COORD_TABLE_PATH'), 'w') as f:
-                        json.dump(new_local_coor_table, f)
-
-                    load_jjwxc_std_font_coord_table.cache_clear()
-
-        out: dict[str, Union[str, bytes, dict[str, str]]] = deepcopy(font)
-        out.pop('ttf', None)
+            unknown_characters = [x for x in _ttf_coordTable if x not in table.keys()]
+            slow_table, _ = await pool.match_font(font.get('ttf_bytes'), unknown_characters)
+            for x in unknown_characters:
+                table[x] = slow_table[x]
+
+            # 记录新学习的 coor table 条目，未匹配到字符的不记录
+            learned_characters = [x for x in unknown_characters if slow_table[x] != '']
+            reference_coor_table = quick.get_reference_coor_table_from_font(learned_characters, font.get('ttf'))
+            learn_jjwxc_std_font_coord_table([
+                [slow_table[x], reference_coor_table[x]] for x in learned_characters
+            ])
+
+        out: dict[str, Union[str, bytes, dict[str, str]]] = {
+            k: v for k, v in font.items() if k not in ('ttf', 'ttf_bytes')
+        }
         out['table'] = table
         return out, 200
     elif status == "404":
@@ -69,6 +68,105 @@ async def _match_jjwxc_font(font_name: str) -> \
         return None, 503
 
 
+# 字体文件锁被占用时重试间隔（秒）
+FONT_LOCK_RETRY_INTERVAL = 0.05
+
+# 进行中的字体解析任务，同一字体同时仅解析一次
+_in_flight: dict[str, concurrent.futures.Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def _to_model(_font: dict[str, Union[str, bytes, dict[str, str]]]) -> Font:
+    return Font(
+        name=_font.get('name'),
+        bytes=_font.get('bytes'),
+        hashsum=_font.get('hashsum'),
+        table=_font.get('table')
+    )
+
+
+def _save_font(_font: dict[str, Union[str, bytes, dict[str, str]]]):
+    db.session.add(_to_model(_font))
+    try:
+        db.session.commit()
+    except sa_exc.IntegrityError:
+        # 其他进程已写入该字体
+        db.session.rollback()
+
+
+def _get_lock_path(font_name: str) -> str:
+    """
+    字体对应的文件锁，按字体名称散列至 FONT_LOCK_STRIPES 个锁文件之一，锁文件数量不随请求的字体增长。
+    散列至同一锁文件的不同字体在多个进程间依次解析。
+    """
+    stripe = zlib.crc32(font_name.encode('utf-8')) % current_app.config.get('FONT_LOCK_STRIPES')
+    return os.path.join(current_app.config.get('FONT_LOCK_DIR'), '{}.lock'.format(stripe))
+
+
+async def _acquire_lock(lock_file):
+    """
+    以非阻塞方式反复尝试获取文件锁，等待期间让出事件循环。
+    不在线程中阻塞等待：gevent worker 中线程即 greenlet ，同一进程内散列至同一锁文件的两个字体会互相死锁。
+    """
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            await asyncio.sleep(FONT_LOCK_RETRY_INTERVAL)
+
+
+async def _match_and_save_font(font_name: str, save=_save_font) -> int:
+    """
+    解析字体并以 save 写入数据库，输出状态码。
+    FONT_LOCK_DIR 非空时以文件锁保证多个进程间同一字体仅解析一次。
+    """
+    if not current_app.config.get('FONT_LOCK_DIR'):
+        _font, status_code = await _match_jjwxc_font(font_name)
+        if status_code == 200:
+            save(_font)
+        return status_code
+
+    with open(_get_lock_path(font_name), 'a') as lock_file:
+        await _acquire_lock(lock_file)
+        try:
+            # 等待锁期间其他进程可能已完成解析
+            if db.session.execute(
+                    sa.select(Font.id).where(Font.name.is_(font_name))
+            ).first() is not None:
+                return 200
+
+            _font, status_code = await _match_jjwxc_font(font_name)
+            if status_code == 200:
+                save(_font)
+            return status_code
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+async def _single_flight_match_and_save_font(font_name: str) -> int:
+    """同一字体的并发请求仅由首个请求解析，其余请求等待其结果"""
+    with _in_flight_lock:
+        future = _in_flight.get(font_name)
+        leader = future is None
+        if leader:
+            future = _in_flight[font_name] = concurrent.futures.Future()
+
+    if not leader:
+        return await asyncio.wrap_future(future)
+
+    try:
+        status_code = await _match_and_save_font(font_name)
+        future.set_result(status_code)
+        return status_code
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(font_name, None)
+
+
 async def match_jjwxc_font(font_name: str) -> \
         Union[
             tuple[None, int],
@@ -81,66 +179,169 @@ async def match_jjwxc_font(font_name: str) -> \
             sa.select(Font).where(Font.name.is_(font_name))
         ).scalar_one(), 200
     except (sa_exc.NoResultFound, sa_exc.MultipleResultsFound):
-        _font, status_code = await _match_jjwxc_font(font_name)
+        status_code = await _single_flight_match_and_save_font(font_name)
         if status_code == 200:
-            font = Font(
-                name=_font.get('name'),
-                bytes=_font.get('bytes'),
-                hashsum=_font.get('hashsum'),
-                table=_font.get('table')
-            )
-            db.session.add(font)
-            db.session.commit()
             return await match_jjwxc_font(font_name)
         else:
             return None, status_code
 
 
+async def match_jjwxc_font_tables(font_names: list[str], concurrency: int) \
+        -> tuple[dict[str, dict[str, str]], dict[str, int]]:
+    """
+    批量查询字体 table ，输出各字体 table 及失败字体的状态码，解析出错的字体记为 500 。
+    已缓存字体一次查询，未缓存字体并发解析，同时解析的数量不超过 concurrency 。
+    """
+    tables: dict[str, dict[str, str]] = {}
+    errors: dict[str, int] = {}
+
+    valid_font_names = []
+    for font_name in font_names:
+        if validator(font_name):
+            valid_font_names.append(font_name)
+        else:
+            errors[font_name] = 403
+
+    if len(valid_font_names) != 0:
+        tables.update(db.session.execute(
+            sa.select(Font.name, Font.table).where(Font.name.in_(valid_font_names))
+        ).all())
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def match(font_name: str):
+        try:
+            async with semaphore:
+                font, status_code = await match_jjwxc_font(font_name)
+        except Exception:
+            # 单个字体解析出错不影响其他字体
+            current_app.logger.exception('match font {} failed'.format(font_name))
+            font, status_code = None, 500
+        if status_code == 200:
+            tables[font_name] = font.table
+        else:
+            errors[font_name] = status_code
+
+    await asyncio.gather(*(match(x) for x in valid_font_names if x not in tables))
+    return tables, errors
+
+
+def _save_fonts(_fonts: list[dict[str, Union[str, bytes, dict[str, str]]]]):
+    """批量写入数据库，存在重复字体时逐个写入"""
+    db.session.add_all([_to_model(x) for x in _fonts])
+    try:
+        db.session.commit()
+    except sa_exc.IntegrityError:
+        db.session.rollback()
+        for _font in _fonts:
+            _save_font(_font)
+
+
+async def warm_fonts(font_names: list[str], concurrency: int, batch_size: int) -> dict[int, int]:
+    """
+    下载并解析若干字体，每 batch_size 个批量写入数据库，输出各状态码计数，解析出错的字体记为 500 。
+    与在线请求共用字体文件锁，其他进程正在解析的字体不再重复解析。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    status_counts: dict[int, int] = {}
+    pending: list[dict[str, Union[str, bytes, dict[str, str]]]] = []
+
+    def save(_font: dict[str, Union[str, bytes, dict[str, str]]]):
+        # 仅加入待写入列表，写入前其他进程仍可能重复解析该字体
+        pending.append(_font)
+        if len(pending) >= batch_size:
+            _save_fonts(pending[:])
+            pending.clear()
+
+    async def warm(font_name: str):
+        try:
+            async with semaphore:
+                status_code = await _match_and_save_font(font_name, save)
+        except Exception as e:
+            current_app.logger.exception('warm font {} failed'.format(font_name))
+            click.echo('{}: {!r}'.format(font_name, e), err=True)
+            status_code = 500
+        else:
+            if status_code != 200:
+                click.echo('{}: {}'.format(font_name, status_code), err=True)
+
+        status_counts[status_code] = status_counts.get(status_code, 0) + 1
+
+    try:
+        await asyncio.gather(*(warm(x) for x in font_names))
+    finally:
+        if len(pending) != 0:
+            _save_fonts(pending)
+    return status_counts
+
+
+fonts_cli = AppGroup('fonts', help='管理字体数据库')
+
+
+@fonts_cli.command('warm')
+@click.argument('input_file', type=click.File('r'), default='-')
+@click.option('--concurrency', type=int, default=8, show_default=True, help='同时下载解析的字体数量')
+@click.option('--batch-size', type=int, default=100, show_default=True, help='每次写入数据库的字体数量')
+@click.option('--workers', type=int, default=None, help='慢速匹配进程数，默认为 SLOW_MATCH_WORKERS')
+def warm_command(input_file, concurrency: int, batch_size: int, workers: int):
+    """预先解析字体并写入数据库，字体名称每行一个，默认自标准输入读取"""
+    font_names = list(dict.fromkeys(
+        x.strip() for x in input_file if validator(x.strip())
+    ))
+    exists = set(db.session.execute(sa.select(Font.name)).scalars())
+    click.echo('{} fonts to warm, {} already exist'.format(
+        len([x for x in font_names if x not in exists]), len([x for x in font_names if x in exists])
+    ))
+    font_names = [x for x in font_names if x not in exists]
+
+    if workers is not None:
+        current_app.config['SLOW_MATCH_WORKERS'] = workers
+    g.slow_match_time = 0
+
+    start_time = time.perf_counter()
+    status_counts = asyncio.run(warm_fonts(font_names, concurrency, batch_size))
+    elapsed = time.perf_counter() - start_time
+
+    click.echo('warmed {} fonts, {} failed in {:.2f}s ({:.2f} fonts/s)'.format(
+        status_counts.get(200, 0), len(font_names) - status_counts.get(200, 0), elapsed,
+        len(font_names) / elapsed if elapsed > 0 else 0
+    ))
+    for status_code, count in sorted(status_counts.items()):
+        if status_code != 200:
+            click.echo('  status {}: {} fonts'.format(status_code, count))
+
+
 def init_app(app: Flask):
+    app.cli.add_command(fonts_cli)
+
     font_dict = {
         "Source Han Sans SC Normal": slow.load_SourceHanSansSC_Normal(),
         "Source Han Sans SC Regular": slow.load_SourceHanSansSC_Regular()
     }
-    npz_path_dict = {
-        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_NPZ_PATH'),
-        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_NPZ_PATH')
-    }
-    josn_path_dict = {
-        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_JSON_PATH'),
-        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_JSON_PATH')
+    bin_path_dict = {
+        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_BIN_PATH'),
+        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_BIN_PATH')
     }
 
     def check(std_font_name: str) -> bool:
-        guest_range = list({*slow.load_jjwxc_std_guest_range(), *commonly_used_character.character_list})
-
-        npz_path = npz_path_dict.get(std_font_name)
-        josn_path = josn_path_dict.get(std_font_name)
-
-        if (not os.path.exists(npz_path)) or (not os.path.exists(josn_path)):
-            return False
+        guest_range = {*slow.load_jjwxc_std_guest_range(), *commonly_used_character.character_list}
 
-        try:
-            std_im_np_arrays = slow.load_std_im_np_arrays(npz_path)
-            std_im_black_point_rates = slow.load_std_im_black_point_rates(josn_path)
-
-            for k in guest_range:
-                if std_im_np_arrays.get(k) is None:
-                    return False
-                if std_im_black_point_rates.get(k) is None:
-                    return False
-        except:
-            return False
-
-        return True
+        return store.check_store(
+            bin_path_dict.get(std_font_name), font_dict.get(std_font_name).path, guest_range,
+            slow.FONT_SIZE, slow.IMAGE_SIZE, slow.IMAGE_BITS_SHAPE[0]
+        )
 
     def update(std_font_name: str):
         current_app.logger.info('update cache of font {}'.format(font_name))
         font = font_dict.get(std_font_name)
-        npz_path = npz_path_dict.get(std_font_name)
-        josn_path = josn_path_dict.get(std_font_name)
+        bin_path = bin_path_dict.get(std_font_name)
 
-        slow.save_std_im_np_arrays(font, npz_path)
-        slow.save_std_im_black_point_rates(font, josn_path)
+        start_time = time.perf_counter()
+        slow.save_std_im_store(font, bin_path, current_app.config.get('STD_CACHE_REBUILD_WORKERS', 1))
+        slow.load_std_im_matrix.cache_clear()
+        current_app.logger.info('updated cache of font {} in {:.2f}s'.format(
+            font_name, time.perf_counter() - start_time
+        ))
 
     for font_name in font_dict.keys():
         if not check(font_name):
@@ -1,56 +1,204 @@
 import asyncio
+import atexit
+import email.utils
 import hashlib
 import io
-import tempfile
-from typing import Union
+import random
+import threading
+import time
+from typing import NamedTuple, Optional, Union
 
 import h2.exceptions
 import httpx
+from flask import current_app
 from fontTools.ttLib import woff2, ttFont
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; WOW64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.5666.197 Safari/537.36",
+    "Accept": "application/font-woff2;q=1.0,application/font-woff;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.5",
+    "Referer": "https://my.jjwxc.net/",
+    "Origin": "https://my.jjwxc.net"
+}
 
-async def request_font(font_name: str, retry: int = 5) \
+
+class RetryPolicy(NamedTuple):
+    """下载字体的重试策略"""
+    max_attempts: int = 5
+    base_delay: float = 0.5
+    multiplier: float = 2.0
+    max_delay: float = 8.0
+    # 抖动比例，实际等待时间在 [delay * (1 - jitter), delay] 间随机取值
+    jitter: float = 0.5
+    # 单次下载（含重试）的总时间上限
+    deadline: float = 15.0
+    timeout: float = 5.0
+    retry_statuses: frozenset[int] = frozenset({408, 425, 429, 500, 502, 503, 504})
+    # 连续失败 breaker_threshold 次后 breaker_reset_timeout 秒内不再请求上游
+    breaker_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    @classmethod
+    def from_config(cls, config) -> 'RetryPolicy':
+        return cls(
+            max_attempts=config.get('FONT_REQUEST_MAX_ATTEMPTS', cls._field_defaults['max_attempts']),
+            base_delay=config.get('FONT_REQUEST_BASE_DELAY', cls._field_defaults['base_delay']),
+            multiplier=config.get('FONT_REQUEST_BACKOFF_MULTIPLIER', cls._field_defaults['multiplier']),
+            max_delay=config.get('FONT_REQUEST_MAX_DELAY', cls._field_defaults['max_delay']),
+            jitter=config.get('FONT_REQUEST_JITTER', cls._field_defaults['jitter']),
+            deadline=config.get('FONT_REQUEST_DEADLINE', cls._field_defaults['deadline']),
+            timeout=config.get('FONT_REQUEST_TIMEOUT', cls._field_defaults['timeout']),
+            retry_statuses=frozenset(
+                config.get('FONT_REQUEST_RETRY_STATUSES', cls._field_defaults['retry_statuses'])
+            ),
+            breaker_threshold=config.get('FONT_REQUEST_BREAKER_THRESHOLD', cls._field_defaults['breaker_threshold']),
+            breaker_reset_timeout=config.get(
+                'FONT_REQUEST_BREAKER_RESET_TIMEOUT', cls._field_defaults['breaker_reset_timeout']
+            )
+        )
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次（自 0 起）失败后的等待时间，上游给出 Retry-After 时以其为准"""
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头，支持秒数及 HTTP 日期"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 熔断器状态：连续失败次数及熔断截止时间
+_breaker_lock = threading.Lock()
+_breaker_failures = 0
+_breaker_open_until = 0.0
+
+
+def is_circuit_open() -> bool:
+    with _breaker_lock:
+        return time.monotonic() < _breaker_open_until
+
+
+def _record_result(success: bool, policy: RetryPolicy):
+    global _breaker_failures, _breaker_open_until
+    with _breaker_lock:
+        if success:
+            _breaker_failures = 0
+            _breaker_open_until = 0.0
+        else:
+            _breaker_failures = _breaker_failures + 1
+            if _breaker_failures >= policy.breaker_threshold:
+                _breaker_open_until = time.monotonic() + policy.breaker_reset_timeout
+
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """
+    获取进程内共享的 HTTP/2 客户端，首次调用时创建。
+    Flask 异步视图每个请求使用独立的事件循环，故使用同步客户端并在线程中调用，以便跨请求复用连接。
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                headers=HEADERS, http2=True, follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=current_app.config.get('HTTP_MAX_CONNECTIONS'),
+                    max_keepalive_connections=current_app.config.get('HTTP_MAX_KEEPALIVE_CONNECTIONS'),
+                    keepalive_expiry=current_app.config.get('HTTP_KEEPALIVE_EXPIRY')
+                )
+            )
+        return _client
+
+
+@atexit.register
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def _request_font(font_name: str, policy: RetryPolicy) \
         -> Union[tuple[bytes, str], tuple[None, str]]:
     url = 'https://static.jjwxc.net/tmp/fonts/{}.woff2?h=my.jjwxc.net'.format(font_name)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; WOW64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.5666.197 Safari/537.36",
-        "Accept": "application/font-woff2;q=1.0,application/font-woff;q=0.9,*/*;q=0.8",
-        "Accept-Language": "zh-CN,zh;q=0.5",
-        "Referer": "https://my.jjwxc.net/",
-        "Origin": "https://my.jjwxc.net"
-    }
-
-    client = httpx.AsyncClient(headers=headers, http2=True)
-    while retry > 0:
+    deadline = time.monotonic() + policy.deadline
+
+    client = get_client()
+    for attempt in range(policy.max_attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        retry_after = None
         try:
-            resp = await client.get(url, headers=headers, timeout=5, follow_redirects=True)
+            resp = await asyncio.to_thread(client.get, url, timeout=min(policy.timeout, remaining))
 
             if 200 <= resp.status_code < 300:
-                await client.aclose()
                 return resp.content, 'OK'
 
             if resp.status_code == 404:
-                await client.aclose()
                 return None, '404'
 
-            retry = retry - 1
+            if resp.status_code not in policy.retry_statuses:
+                break
+            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
 
         except (httpx.TransportError, h2.exceptions.ProtocolError):
-            await asyncio.sleep(5)
-            retry = retry - 1
+            pass
+
+        if attempt + 1 < policy.max_attempts:
+            delay = policy.get_delay(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
 
-    await client.aclose()
     return None, 'ERROR'
 
 
+async def request_font(font_name: str, policy: RetryPolicy = None) \
+        -> Union[tuple[bytes, str], tuple[None, str]]:
+    """
+    下载字体，按 policy 以指数退避重试，默认读取 app config。
+    上游连续失败时熔断，熔断期间直接输出 ERROR 。
+    """
+    policy = policy or RetryPolicy.from_config(current_app.config)
+
+    if is_circuit_open():
+        return None, 'ERROR'
+
+    font_bytes, status = await _request_font(font_name, policy)
+    _record_result(status != 'ERROR', policy)
+    return font_bytes, status
+
+
+def decompress_woff2(input_bytes: bytes) -> io.BytesIO:
+    """将 woff2 bytes 解压至内存"""
+    output_file = io.BytesIO()
+    with io.BytesIO(input_bytes) as input_file:
+        woff2.decompress(input_file, output_file)
+    output_file.seek(0)
+    return output_file
+
+
 def woff2_to_ttf(input_bytest: bytes):
     """将 woff2 bytes 转捣为 TTFont 对象"""
-    with io.BytesIO(input_bytest) as input_file:
-        with tempfile.TemporaryFile() as tmp:
-            woff2.decompress(input_file, tmp)
-            tmp.seek(0)
-            ttf = ttFont.TTFont(tmp)
-            return ttf
+    return ttFont.TTFont(decompress_woff2(input_bytest))
 
 
 async def get_font(font_name: str) -> dict[str, Union[str, bytes, ttFont.TTFont]]:
@@ -61,10 +209,13 @@ async def get_font(font_name: str) -> dict[str, Union[str, bytes, ttFont.TTFont]
         m.update(font_bytes)
         hashsum = m.hexdigest()
 
+        # 仅解压一次，TTFont 与 PIL 字体共用解压结果；TTFont 仅在访问时解析所需的表
+        ttf_fd = decompress_woff2(font_bytes)
         return {
             "name": font_name,
             "bytes": font_bytes,
-            "ttf": woff2_to_ttf(font_bytes),
+            "ttf": ttFont.TTFont(ttf_fd, lazy=True),
+            "ttf_bytes": ttf_fd.getvalue(),
             "hashsum": hashsum,
             "status": status
         }
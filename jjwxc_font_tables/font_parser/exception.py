@@ -1,6 +0,0 @@
-class MatchError(BaseException):
-    pass
-
-
-class ImageMatchError(BaseException):
-    pass
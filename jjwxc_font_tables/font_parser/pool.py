@@ -0,0 +1,116 @@
+# 慢速匹配进程池
+# 每个 gunicorn worker 进程各自持有一个进程池，于首次慢速匹配时创建：
+# gunicorn 以 --preload 在主进程创建应用后 fork 出各 worker ，进程池不能在 fork 前创建。
+# 标准图像缓存以只读 mmap 映射，各子进程共享同一份页缓存，不各自复制。
+# 总子进程数为 gunicorn worker 数 × SLOW_MATCH_WORKERS ，故 SLOW_MATCH_WORKERS 默认为 1 。
+import asyncio
+import atexit
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import numpy as np
+from PIL import ImageFont
+from flask import current_app, g
+
+from . import slow
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# 子进程中的标准图像矩阵，以只读 mmap 方式与其他进程共享
+_std_matrices: dict[str, tuple[dict[str, int], np.ndarray, np.ndarray]] = {}
+
+
+def _init_worker(std_cache_paths: dict[str, str]):
+    """子进程初始化：映射标准图像缓存文件"""
+    for std_font_name, bin_path in std_cache_paths.items():
+        _std_matrices[std_font_name] = slow.load_std_im_matrix(bin_path)
+
+
+def _match_font(std_font_name: str, font_bytes: bytes, characters: list[str], guest_range: list[str]) \
+        -> tuple[list[str], list[float], int]:
+    """子进程中匹配字体，标准字体未知时使用 Source Han Sans SC Normal"""
+    std_matrix = _std_matrices.get(std_font_name) or _std_matrices.get("Source Han Sans SC Normal")
+    with io.BytesIO(font_bytes) as font_fd:
+        test_font = slow.load_test_font(font_fd)
+        test_bits = slow.render_bits(characters, test_font)
+
+    return slow.match_test_bits(test_bits, *slow.select_guest_range(std_matrix, guest_range))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """获取当前进程的慢速匹配进程池，首次调用时创建"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            return _executor
+
+        std_cache_paths = {
+            ' '.join(std_font.getname()): slow.get_std_cache_path(std_font)
+            for std_font in (slow.load_SourceHanSansSC_Normal(), slow.load_SourceHanSansSC_Regular())
+        }
+
+        _executor = ProcessPoolExecutor(
+            max_workers=current_app.config.get('SLOW_MATCH_WORKERS'),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(std_cache_paths,)
+        )
+        current_app.logger.info('start slow match pool with {} workers'.format(
+            current_app.config.get('SLOW_MATCH_WORKERS')
+        ))
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """丢弃已损坏的进程池，下次慢速匹配时重新创建；其他请求已重建的进程池不受影响"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def match_font(font_bytes: bytes, characters: list[str], std_font: ImageFont.FreeTypeFont = None,
+                     guest_range: list[str] = None) -> tuple[dict[str, str], dict[str, float]]:
+    """
+    在进程池中匹配字体，输出匹配结果及各字符匹配率。
+    SLOW_MATCH_WORKERS 为 0 时于当前进程中匹配。
+    子进程异常退出时抛出 BrokenProcessPool ，并丢弃进程池，下次匹配时重新创建。
+    """
+    std_font = std_font or slow.load_SourceHanSansSC_Normal()
+    guest_range = guest_range or slow.load_jjwxc_std_guest_range()
+
+    if len(characters) == 0:
+        return {}, {}
+
+    if current_app.config.get('SLOW_MATCH_WORKERS', 0) <= 0:
+        with io.BytesIO(font_bytes) as font_fd:
+            return slow.match_font_with_confidence(slow.load_test_font(font_fd), characters, std_font, guest_range)
+
+    executor = get_executor()
+    try:
+        most_match_characters, most_match_rates, match_times = await asyncio.wrap_future(executor.submit(
+            _match_font, ' '.join(std_font.getname()), font_bytes, characters, guest_range
+        ))
+    except BrokenProcessPool:
+        # 子进程异常退出后进程池不再可用
+        current_app.logger.warning('slow match pool is broken, restart on next match')
+        _discard_executor(executor)
+        raise
+    g.slow_match_time = g.slow_match_time + match_times
+
+    return dict(zip(characters, most_match_characters)), dict(zip(characters, most_match_rates))
@@ -1,9 +1,15 @@
-from copy import deepcopy
-from typing import Union
+import threading
+from typing import Iterable, Iterator, Optional, Union
 
+import numpy as np
 from fontTools.ttLib import ttFont
 
-from jjwxc_font_tables.lib import load_jjwxc_std_font_coord_table
+from jjwxc_font_tables.lib import load_jjwxc_std_font_coord_table_with_generation
+
+# 坐标模糊匹配容差
+FUZZ = 20
+# coord table 坐标所用的 unitsPerEm
+REFERENCE_UNITS_PER_EM = 1000
 
 
 def list_ttf_characters(ttf: ttFont.TTFont) -> list[str]:
@@ -16,28 +22,150 @@ def list_ttf_characters(ttf: ttFont.TTFont) -> list[str]:
     ))
 
 
+def _segment_exclusive_cumsum(values: np.ndarray, segment_starts: np.ndarray, segment_ids: np.ndarray) \
+        -> np.ndarray:
+    """分段计算不含自身的累加和"""
+    exclusive = np.cumsum(values) - values
+    return exclusive - exclusive[segment_starts][segment_ids]
+
+
+def _decode_axis(buf: np.ndarray, starts: np.ndarray, flags: np.ndarray, point_starts: np.ndarray,
+                 glyph_ids: np.ndarray, short_bit: int, same_bit: int) -> tuple[np.ndarray, np.ndarray]:
+    """一次解码全部简单字形的单个坐标轴，输出各点绝对坐标及各字形该轴数据结束位置"""
+    short = (flags & short_bit) != 0
+    same = (flags & same_bit) != 0
+    size = np.where(short, 1, np.where(same, 0, 2))
+    offsets = starts[glyph_ids] + _segment_exclusive_cumsum(size, point_starts, glyph_ids)
+
+    delta = np.zeros(len(flags), dtype=np.int32)
+    short_values = buf[offsets[short]].astype(np.int32)
+    delta[short] = np.where(same[short], short_values, -short_values)
+    long = size == 2
+    delta[long] = ((buf[offsets[long]].astype(np.uint16) << 8) | buf[offsets[long] + 1]).view(np.int16)
+
+    size_sums = np.zeros(len(starts), dtype=np.int64)
+    np.add.at(size_sums, glyph_ids, size)
+    return _segment_exclusive_cumsum(delta, point_starts, glyph_ids) + delta, starts + size_sums
+
+
+def _decode_glyphs(glyf_data: bytes, spans: list[tuple[int, int]]) -> list[Optional[np.ndarray]]:
+    """
+    解码 glyf 表中若干简单字形的坐标，输出各字形 (点数, 2) 数组，复合字形输出 None 。
+    标志位逐字形展开，坐标数据则对全部字形一次性解码。
+    """
+    out: list[Optional[np.ndarray]] = [None] * len(spans)
+    decoded: list[int] = []
+    starts: list[int] = []
+    counts: list[int] = []
+    all_flags = bytearray()
+
+    for i, (start, end) in enumerate(spans):
+        if start == end:
+            out[i] = np.zeros((0, 2), dtype=np.int16)
+            continue
+
+        number_of_contours = int.from_bytes(glyf_data[start:start + 2], 'big', signed=True)
+        if number_of_contours < 0:
+            continue
+
+        pos = start + 10 + 2 * number_of_contours
+        n = int.from_bytes(glyf_data[pos - 2:pos], 'big') + 1 if number_of_contours > 0 else 0
+        pos = pos + 2 + int.from_bytes(glyf_data[pos:pos + 2], 'big')
+
+        flags = bytearray()
+        while len(flags) < n:
+            flag = glyf_data[pos]
+            pos = pos + 1
+            if flag & 0x08:
+                flags.extend(bytes([flag]) * (glyf_data[pos] + 1))
+                pos = pos + 1
+            else:
+                flags.append(flag)
+
+        all_flags.extend(flags[:n])
+        decoded.append(i)
+        starts.append(pos)
+        counts.append(n)
+
+    if len(decoded) == 0:
+        return out
+
+    buf = np.frombuffer(glyf_data, dtype=np.uint8)
+    flags = np.frombuffer(all_flags, dtype=np.uint8)
+    counts = np.array(counts, dtype=np.int64)
+    point_starts = np.cumsum(counts) - counts
+    glyph_ids = np.repeat(np.arange(len(decoded)), counts)
+    # 空字形的起点不会被引用，截断以免越界
+    point_starts = np.minimum(point_starts, max(len(flags) - 1, 0))
+
+    x, y_starts = _decode_axis(buf, np.array(starts, dtype=np.int64), flags, point_starts, glyph_ids, 0x02, 0x10)
+    y, _ = _decode_axis(buf, y_starts, flags, point_starts, glyph_ids, 0x04, 0x20)
+    coors = np.stack([x, y], axis=1).astype(np.int16)
+
+    for i, coor in zip(decoded, np.split(coors, np.cumsum(counts)[:-1])):
+        out[i] = coor
+    return out
+
+
+def _get_raw_table(ttf: ttFont.TTFont, tag: str) -> bytes:
+    """读取原始表数据，已解析的表不再重新编译"""
+    if ttf.reader is not None and tag in ttf.reader:
+        return ttf.reader[tag]
+    return ttf.getTableData(tag)
+
+
+def iter_font_coors(ttf: ttFont.TTFont, characters: Iterable[str] = None) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    输入 ttf 对象，逐个输出字符及其 (点数, 2) 坐标数组，characters 为空时输出全部字符。
+    仅解析 cmap ，glyf 直接按 loca 读取原始数据解码，不构建 fontTools 字形对象。
+    """
+    cmap = ttf.getBestCmap()
+    items = list(cmap.items()) if characters is None else [(ord(x), cmap[ord(x)]) for x in characters]
+
+    glyf_data = _get_raw_table(ttf, 'glyf')
+    loca_format = '>u4' if ttf['head'].indexToLocFormat else '>u2'
+    loca = np.frombuffer(_get_raw_table(ttf, 'loca'), dtype=loca_format).astype(np.int64)
+    if loca_format == '>u2':
+        loca = loca * 2
+
+    glyph_ids = [ttf.getGlyphID(glyph_name) for _, glyph_name in items]
+    spans = [(int(loca[x]), int(loca[x + 1])) for x in glyph_ids]
+
+    for (code, glyph_name), coor in zip(items, _decode_glyphs(glyf_data, spans)):
+        if coor is None:
+            glyf = ttf['glyf']
+            coor = np.array(glyf[glyph_name].getCoordinates(glyf)[0], dtype=np.int16).reshape(-1, 2)
+        yield chr(code), coor
+
+
 def get_character_coor_table_from_font(character: str, ttf: ttFont.TTFont) \
         -> list[tuple[int, int]]:
     """输入 ttf 对象及指定字符，输出该字体下该字符 coordTable"""
-    cmap = ttf.getBestCmap()
-    glyf_name = cmap[ord(character)]
-    coord = ttf['glyf'][glyf_name].coordinates
-    coord_list = list(coord)
-    return coord_list
+    _, coor = next(iter_font_coors(ttf, [character]))
+    return [tuple(x) for x in coor.tolist()]
 
 
-def get_font_coor_table(ttf: ttFont.TTFont) -> dict[str, list[tuple[int, int]]]:
-    """输入 ttf 对象，输出相应的 coord table"""
-    characters = list_ttf_characters(ttf)
-    font_coord_table = dict(zip(
-        characters,
-        map(
-            lambda x: get_character_coor_table_from_font(x, ttf),
-            characters
-        )
-    ))
+def get_reference_coor_table_from_font(characters: list[str], ttf: ttFont.TTFont) \
+        -> dict[str, list[tuple[int, int]]]:
+    """
+    输入 ttf 对象及若干字符，输出各字符缩放至 REFERENCE_UNITS_PER_EM 后的 coordTable 。
+    学习的 coord table 条目均以此记录，与标准 coord table 单位一致。
+    """
+    units_per_em = ttf['head'].unitsPerEm
+    return {
+        character: [tuple(x) for x in scale_coors(coor, units_per_em).tolist()]
+        for character, coor in iter_font_coors(ttf, characters)
+    }
+
+
+def get_font_coor_table(ttf: ttFont.TTFont) -> dict[str, np.ndarray]:
+    """输入 ttf 对象，输出相应的 coord table ，坐标为 (点数, 2) 数组"""
+    return dict(iter_font_coors(ttf))
 
-    return font_coord_table
+
+def _coor_array(coors: list[list[tuple[int, int]]], length: int) -> np.ndarray:
+    """将点数相同的若干 coor 合并为 (个数, 点数, 2) 数组"""
+    return np.array(coors, dtype=np.int32).reshape(len(coors), length, 2)
 
 
 def is_glpyh_similar(a: list[tuple[int, int]], b: list[tuple[int, int]], fuzz: int) -> bool:
@@ -47,32 +175,169 @@ def is_glpyh_similar(a: list[tuple[int, int]], b: list[tuple[int, int]], fuzz: i
     """
     if len(a) != len(b):
         return False
-    found = True
-    for ii in range(len(a)):
-        if abs(a[ii][0] - b[ii][0]) > fuzz or abs(a[ii][1] - b[ii][1]) > fuzz:
-            found = False
-            break
-    return found
+    return bool(np.abs(_coor_array([a], len(a)) - _coor_array([b], len(b))).max(initial=0) <= fuzz)
+
+
+def build_coord_index(coord_table: list[tuple[str, list[tuple[int, int]]]]) \
+        -> dict[int, tuple[list[str], np.ndarray]]:
+    """按点数将 coord table 分组，各组 coor 合并为一个 (个数, 点数, 2) 数组"""
+    groups: dict[int, list[tuple[str, list[tuple[int, int]]]]] = {}
+    for character, coor in coord_table:
+        groups.setdefault(len(coor), []).append((character, coor))
+
+    return {
+        length: (
+            [character for character, _ in items],
+            _coor_array([coor for _, coor in items], length)
+        )
+        for length, items in groups.items()
+    }
+
+
+def merge_coord_index(index: dict[int, tuple[list[str], np.ndarray]],
+                      other: dict[int, tuple[list[str], np.ndarray]]) -> dict[int, tuple[list[str], np.ndarray]]:
+    """将 other 各组追加至 index 同点数组末尾，输出新索引，原索引不变"""
+    out = dict(index)
+    for length, (characters, coors) in other.items():
+        if length in out:
+            old_characters, old_coors = out[length]
+            out[length] = ([*old_characters, *characters], np.concatenate([old_coors, coors]))
+        else:
+            out[length] = (characters, coors)
+    return out
+
+
+def extend_coord_index(index: dict[int, tuple[list[str], np.ndarray]],
+                       coord_table: list[tuple[str, list[tuple[int, int]]]]) \
+        -> dict[int, tuple[list[str], np.ndarray]]:
+    """将新增条目追加至 coord table 索引末尾，输出新索引，原索引不变"""
+    return merge_coord_index(index, build_coord_index(coord_table))
+
+
+def scale_coors(coors: np.ndarray, units_per_em: int) -> np.ndarray:
+    """将坐标数组自 units_per_em 缩放至 REFERENCE_UNITS_PER_EM"""
+    if units_per_em == REFERENCE_UNITS_PER_EM:
+        return coors
+    return np.rint(coors * (REFERENCE_UNITS_PER_EM / units_per_em)).astype(np.int32)
+
+
+def normalize_coors(coors: np.ndarray, units_per_em: int = REFERENCE_UNITS_PER_EM) -> np.ndarray:
+    """将 (个数, 点数, 2) 数组中各 coor 按外框平移至原点，并缩放至 REFERENCE_UNITS_PER_EM"""
+    if coors.shape[1] == 0:
+        return coors
+
+    return scale_coors(coors - coors.min(axis=1, keepdims=True), units_per_em)
+
+
+def normalize_coord_index(index: dict[int, tuple[list[str], np.ndarray]]) \
+        -> dict[int, tuple[list[str], np.ndarray]]:
+    """归一化 coord table 索引中的全部 coor"""
+    return {length: (characters, normalize_coors(coors)) for length, (characters, coors) in index.items()}
+
+
+def build_coord_index_from_arrays(characters: list[str], offsets: np.ndarray, coords: np.ndarray) \
+        -> dict[int, tuple[list[str], np.ndarray]]:
+    """由编译后的 coord table（字符、坐标起点、坐标数组）构建索引，结果与 build_coord_index 相同"""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+
+    index = {}
+    for length in np.unique(lengths).tolist():
+        rows = np.flatnonzero(lengths == length)
+        points = offsets[rows][:, None] + np.arange(length)
+        index[length] = (
+            [characters[x] for x in rows.tolist()],
+            np.asarray(coords[points], dtype=np.int32).reshape(len(rows), length, 2)
+        )
+    return index
+
+
+# 已构建的索引、归一化索引及其对应的 coord table 世代、已加入的学习条目数
+_coord_index: Optional[dict[int, tuple[list[str], np.ndarray]]] = None
+_normalized_coord_index: Optional[dict[int, tuple[list[str], np.ndarray]]] = None
+_coord_index_generation = 0
+_coord_index_entries = 0
+_coord_index_lock = threading.Lock()
+
+
+def _load_coord_indexes() -> tuple[dict[int, tuple[list[str], np.ndarray]], dict[int, tuple[list[str], np.ndarray]]]:
+    global _coord_index, _normalized_coord_index, _coord_index_generation, _coord_index_entries
+
+    coord_table, generation = load_jjwxc_std_font_coord_table_with_generation()
+
+    with _coord_index_lock:
+        if _coord_index is None or generation != _coord_index_generation \
+                or len(coord_table.entries) < _coord_index_entries:
+            _coord_index = extend_coord_index(
+                build_coord_index_from_arrays(coord_table.characters, coord_table.offsets, coord_table.coords),
+                coord_table.entries
+            )
+            _normalized_coord_index = normalize_coord_index(_coord_index)
+        elif len(coord_table.entries) > _coord_index_entries:
+            new_index = build_coord_index(coord_table.entries[_coord_index_entries:])
+            _coord_index = merge_coord_index(_coord_index, new_index)
+            _normalized_coord_index = merge_coord_index(_normalized_coord_index, normalize_coord_index(new_index))
+        _coord_index_generation = generation
+        _coord_index_entries = len(coord_table.entries)
+        return _coord_index, _normalized_coord_index
+
+
+def match_similar_characters(coors: np.ndarray, index: dict[int, tuple[list[str], np.ndarray]],
+                             fuzz: int = FUZZ) -> list[Optional[str]]:
+    """
+    输入 (个数, 点数, 2) 数组，一次比较其与 coord table 索引中同点数的全部 coor。
+    输出各 coor 相似的字符，多个相似时取 coord table 中靠后者。
+    """
+    group = index.get(coors.shape[1])
+    if group is None:
+        return [None] * len(coors)
+    std_characters, std_coors = group
+
+    # similar[i, j]: 第 i 个 coor 与第 j 个标准 coor 是否相似
+    similar = np.abs(coors[:, None] - std_coors[None]).max(axis=(2, 3), initial=0) <= fuzz
+    last_similar = len(std_characters) - 1 - np.argmax(similar[:, ::-1], axis=1)
+
+    return [
+        std_characters[j] if found else None
+        for j, found in zip(last_similar, similar.any(axis=1))
+    ]
 
 
 def match_jjwxc_font(ttf: ttFont.TTFont) -> Union[tuple[dict[str, str], str], tuple[dict[str, str], list[str]]]:
-    """输入晋江文学城字体对应的 ttf 对象，输出匹配后结果"""
-    jjwxc_std_coord_table = load_jjwxc_std_font_coord_table()
+    """
+    输入晋江文学城字体对应的 ttf 对象，输出匹配后结果。
+    先比较原始坐标，未匹配的字符再以平移、缩放归一化后的坐标比较。
+    """
+    jjwxc_std_coord_index, jjwxc_std_normalized_coord_index = _load_coord_indexes()
     ttf_coord_table = get_font_coor_table(ttf)
+    units_per_em = ttf['head'].unitsPerEm
 
     # 移除晋江文学城字体 X 字符
-    _ttf_coordTable = deepcopy(ttf_coord_table)
+    _ttf_coordTable = dict(ttf_coord_table)
     _ttf_coordTable.pop('x', None)
 
+    # 按点数分组，每组仅需一次比较
+    ttf_groups: dict[int, list[str]] = {}
+    for ttf_character, ttf_coor in _ttf_coordTable.items():
+        ttf_groups.setdefault(len(ttf_coor), []).append(ttf_character)
+
     out = {}
 
-    # noinspection PyPep8Naming
-    FUZZ = 20
-    for jj_std_item in jjwxc_std_coord_table:
-        for ttf_item in _ttf_coordTable.items():
-            if is_glpyh_similar(jj_std_item[1], ttf_item[1], FUZZ):
-                out[ttf_item[0]] = jj_std_item[0]
-                break
+    for length, ttf_characters in ttf_groups.items():
+        ttf_coors = _coor_array([_ttf_coordTable[x] for x in ttf_characters], length)
+        std_characters = match_similar_characters(ttf_coors, jjwxc_std_coord_index)
+
+        unmatched = [i for i, x in enumerate(std_characters) if x is None]
+        if len(unmatched) != 0:
+            normalized_std_characters = match_similar_characters(
+                normalize_coors(ttf_coors[unmatched], units_per_em), jjwxc_std_normalized_coord_index
+            )
+            for i, std_character in zip(unmatched, normalized_std_characters):
+                std_characters[i] = std_character
+
+        for ttf_character, std_character in zip(ttf_characters, std_characters):
+            if std_character is not None:
+                out[ttf_character] = std_character
 
     if len(_ttf_coordTable) == len(out):
         return out, "OK"
@@ -1,5 +1,6 @@
-import json
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import lru_cache
 from typing import IO
 
@@ -8,15 +9,24 @@ from PIL import Image, ImageDraw, ImageFont
 from flask import current_app, g
 from fontTools.ttLib import ttFont
 
+from . import store
 from .commonly_used_character import character_list
-from .exception import ImageMatchError
 from .quick import list_ttf_characters
-from ..lib import load_jjwxc_std_font_coord_table
+from ..lib import load_jjwxc_std_font_coord_table_with_generation
 
 # 默认字号 32 px
 # 行高 1.2 倍
 FONT_SIZE = 96
 IMAGE_SIZE = (math.ceil(FONT_SIZE * 1.2), math.ceil(FONT_SIZE * 1.2))
+# 图像黑色部分按位压缩后大小
+IMAGE_BITS_SHAPE = (math.ceil(IMAGE_SIZE[0] * IMAGE_SIZE[1] / 8),)
+
+# 各字节中 1 的个数
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+# 矩阵比较时每批解包的标准图像数量
+MATRIX_CHUNK_SIZE = 512
+# 并行重建标准图像缓存时每批渲染的字符数量
+RENDER_CHUNK_SIZE = 256
 
 
 @lru_cache
@@ -24,6 +34,12 @@ def _load_font(font, size=FONT_SIZE):
     return ImageFont.truetype(font, size=size)
 
 
+def load_test_font(font_fd: IO) -> ImageFont.FreeTypeFont:
+    """载入待匹配字体，不缓存"""
+    font_fd.seek(0)
+    return ImageFont.truetype(font_fd, size=FONT_SIZE)
+
+
 def load_SourceHanSansSC_Normal() -> ImageFont.FreeTypeFont:
     return _load_font(current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_PATH'))
 
@@ -33,13 +49,12 @@ def load_SourceHanSansSC_Regular() -> ImageFont.FreeTypeFont:
 
 
 def load_jjwxc_std_guest_range() -> list[str]:
+    coord_table, _ = load_jjwxc_std_font_coord_table_with_generation()
     return list(set(
         filter(
-            lambda x: x != 'x',
-            map(
-                lambda x: x[0],
-                load_jjwxc_std_font_coord_table()
-            ))
+            lambda x: x != 'x' and len(x) == 1,
+            [*coord_table.characters, *map(lambda x: x[0], coord_table.entries)]
+        )
     ))
 
 
@@ -72,127 +87,236 @@ def draw(text: str, font: ImageFont.FreeTypeFont, size: tuple[int, int] = IMAGE_
     return image
 
 
-def compare_im_np(test_array: np.ndarray, std_array: np.ndarray):
-    if test_array.shape != std_array.shape:
-        raise ImageMatchError("图像大小不一致")
-
-    g.slow_match_time = g.slow_match_time + 1
-    # 获取图像黑色部分
-    test_black_array = test_array == False
-    std_black_array = std_array == False
-
-    # 求出共同黑色部分
-    common_black_array = test_black_array & std_black_array
-
-    # 输出共同黑色部分占测试图像比例
-    return np.count_nonzero(common_black_array) / np.count_nonzero(test_black_array)
-
-
-def match_test_im_with_cache(test_im: Image, std_font: ImageFont.FreeTypeFont, guest_range: list[str]):
-    test_array = np.asarray(test_im)
-
-    npz_path_dict = {
-        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_NPZ_PATH'),
-        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_NPZ_PATH')
-    }
-    npz_path = npz_path_dict.get(' '.join(std_font.getname())) \
-               or current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_NPZ_PATH')
-
-    josn_path_dict = {
-        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_JSON_PATH'),
-        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_JSON_PATH')
-    }
-    josn_path = josn_path_dict.get(' '.join(std_font.getname())) \
-                or current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_JSON_PATH')
-
-    std_im_np_arrays = load_std_im_np_arrays(npz_path)
-    std_im_black_point_rates = load_std_im_black_point_rates(josn_path)
-
-    match_result = {}
+def im_to_bits(im: Image) -> np.ndarray:
+    """将图像黑色部分按位压缩为一维 uint8 数组"""
+    return np.packbits(np.asarray(im) == False)
 
-    most_match_rate: float = 0.0
-    most_match: str = ''
 
-    test_im_black_point_rate = get_im_black_point_rate(test_im)
-    for text in guest_range:
-        if abs(test_im_black_point_rate - std_im_black_point_rates[text]) / test_im_black_point_rate > 0.2:
-            # 跳过黑色比例相较其自身差异 20% 以上的标准字符
+def count_common_bits(test_bits: np.ndarray, std_bits: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    输入 (m, 字节数) 测试图像矩阵、(n, 字节数) 标准图像矩阵及各测试图像需比较的标准图像区间 [lo, hi) ，
+    以矩阵乘法求出 (m, n) 共同黑色点数。
+    标准图像分批解包，每批仅与区间相交的测试图像相乘，未相乘部分记为 nan 。
+    """
+    test_matrix = np.unpackbits(test_bits, axis=1).astype(np.float32)
+    counts = np.full((len(test_bits), len(std_bits)), np.nan, dtype=np.float32)
+    for start in range(0, len(std_bits), MATRIX_CHUNK_SIZE):
+        stop = min(start + MATRIX_CHUNK_SIZE, len(std_bits))
+        rows = np.flatnonzero((lo < stop) & (hi > start))
+        if len(rows) == 0:
             continue
+        std_matrix = np.unpackbits(std_bits[start:stop], axis=1).astype(np.float32)
+        counts[rows, start:stop] = test_matrix[rows] @ std_matrix.T
+    return counts
 
-        std_array = std_im_np_arrays[text]
-        match_rate = compare_im_np(test_array, std_array)
 
-        match_result[text] = match_rate
+def get_rate_windows(test_rates: np.ndarray, std_rates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    输入测试图像黑色比例及升序排列的标准图像黑色比例，以二分查找求出各测试图像需比较的标准图像区间 [lo, hi) 。
+    区间外的标准图像黑色比例相较测试图像差异 20% 以上。
+    """
+    lo = np.searchsorted(std_rates, test_rates * 0.8, side='left')
+    hi = np.searchsorted(std_rates, test_rates * 1.2, side='right')
+    return lo, hi
 
-        if match_rate > most_match_rate:
-            most_match = text
-            most_match_rate = match_rate
 
-    return most_match, match_result
+def match_bits_matrix(test_bits: np.ndarray, std_bits: np.ndarray, std_rates: np.ndarray) -> np.ndarray:
+    """
+    一次比较全部测试图像与标准图像，输出 (m, n) 共同黑色部分占测试图像比例。
+    标准图像须按黑色比例升序排列。
+    跳过黑色比例相较测试图像差异 20% 以上的标准图像，其比例记为 nan 。
+    """
+    test_counts = POPCOUNT_TABLE[test_bits].sum(axis=1)
+    test_rates = test_counts / (IMAGE_SIZE[0] * IMAGE_SIZE[1])
 
+    match_rates = np.full((len(test_bits), len(std_bits)), np.nan)
 
-def save_std_im_np_arrays(std_font: ImageFont.FreeTypeFont, npz_path: str):
-    guest_range = list({*load_jjwxc_std_guest_range(), *character_list})
+    lo, hi = get_rate_windows(test_rates, std_rates)
+    # 仅解包至少一个测试图像需要比较的标准图像
+    start, stop = lo.min(initial=len(std_bits)), hi.max(initial=0)
+    if start >= stop:
+        return match_rates
 
-    npz_dict = {}
+    columns = np.arange(start, stop)
+    compare = (columns >= lo[:, None]) & (columns < hi[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _match_rates = count_common_bits(test_bits, std_bits[start:stop], lo - start, hi - start) \
+            / test_counts[:, None]
+    match_rates[:, start:stop] = np.where(compare, _match_rates, np.nan)
 
-    for text in guest_range:
-        std_im = draw(text, std_font)
-        std_array = np.asarray(std_im)
-        npz_dict[text] = std_array
-
-    np.savez_compressed(npz_path, **npz_dict)
+    return match_rates
 
 
 @lru_cache
-def load_std_im_np_arrays(npz_path: str):
-    with np.load(npz_path, mmap_mode='r') as _std_im_np_arrays:
-        std_im_np_arrays = {}
-        for key in _std_im_np_arrays.keys():
-            std_im_np_arrays[key] = _std_im_np_arrays.get(key)
-
-    return std_im_np_arrays
-
-
-def get_im_black_point_rate(im: Image):
-    std_array = np.asarray(im)
-    std_black_array = std_array == False
-    return np.count_nonzero(std_black_array) / std_array.size
-
-
-def save_std_im_black_point_rates(std_font: ImageFont.FreeTypeFont, josn_path: str):
-    guest_range = list({*load_jjwxc_std_guest_range(), *character_list})
-
-    json_dict = {}
-
-    for text in guest_range:
-        std_im = draw(text, std_font)
-        json_dict[text] = get_im_black_point_rate(std_im)
+def load_std_im_matrix(bin_path: str) -> tuple[dict[str, int], np.ndarray, np.ndarray]:
+    """
+    以只读 mmap 方式载入标准图像缓存文件，输出字符行号、(字符数, 字节数) 图像矩阵及升序排列的黑色比例。
+    各进程共享同一份页缓存。
+    """
+    _, std_index, std_bits, std_rates = store.load_store(bin_path)
+    return std_index, std_bits, std_rates
+
+
+def get_std_cache_path(std_font: ImageFont.FreeTypeFont) -> str:
+    """输出标准字体对应的标准图像缓存文件路径"""
+    bin_path_dict = {
+        "Source Han Sans SC Normal": current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_BIN_PATH'),
+        "Source Han Sans SC Regular": current_app.config.get('SOURCE_HAN_SANS_SC_REGULARL_BIN_PATH')
+    }
+    return bin_path_dict.get(' '.join(std_font.getname())) \
+        or current_app.config.get('SOURCE_HAN_SANS_SC_NORMAL_BIN_PATH')
+
+
+def select_guest_range(std_matrix: tuple[dict[str, int], np.ndarray, np.ndarray], guest_range: list[str]) \
+        -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    从标准图像矩阵中取出 guest_range ，输出按黑色比例升序排列的字符，及其对应的标准图像矩阵与黑色比例。
+    跳过标准图像矩阵中没有的字符。
+    """
+    std_index, std_bits, std_rates = std_matrix
+
+    # 标准图像已按黑色比例排序，按行号顺序取出即保持升序
+    in_guest_range = np.zeros(len(std_bits), dtype=bool)
+    in_guest_range[[std_index[x] for x in guest_range if x in std_index]] = True
+    guest_rows = np.flatnonzero(in_guest_range)
+
+    std_characters = list(std_index.keys())
+    return [std_characters[i] for i in guest_rows], std_bits[guest_rows], std_rates[guest_rows]
+
+
+def load_guest_range_matrix(std_font: ImageFont.FreeTypeFont, guest_range: list[str]) \
+        -> tuple[list[str], np.ndarray, np.ndarray]:
+    return select_guest_range(load_std_im_matrix(get_std_cache_path(std_font)), guest_range)
+
+
+def get_most_match(match_rates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    输入 (m, n) 匹配率矩阵，输出各测试图像最高匹配率所在列及该匹配率。
+    无可比较标准图像或最高匹配率为 0 时，所在列为 -1 。
+    """
+    _match_rates = np.where(np.isnan(match_rates), 0.0, match_rates)
+    most_match_index = np.argmax(_match_rates, axis=1)
+    most_match_rates = _match_rates[np.arange(len(_match_rates)), most_match_index]
+    most_match_index[most_match_rates <= 0] = -1
+    return most_match_index, most_match_rates
+
+
+def _render_font_bits(font_path: str, characters: list[str]) -> np.ndarray:
+    """子进程中载入字体并渲染字符"""
+    return render_bits(characters, _load_font(font_path))
+
+
+def render_bits_parallel(font_path: str, characters: list[str], workers: int) -> np.ndarray:
+    """分批于多个进程中渲染字符，输出 (字符数, 字节数) 图像矩阵，并记录进度"""
+    chunks = [characters[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(characters), RENDER_CHUNK_SIZE)]
+    results: list[np.ndarray] = [np.empty((0, *IMAGE_BITS_SHAPE), dtype=np.uint8)] * len(chunks)
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_font_bits, font_path, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            rendered = rendered + len(chunks[futures[future]])
+            current_app.logger.info('render {}: {}/{}'.format(os.path.basename(font_path), rendered, len(characters)))
+
+    return np.concatenate(results)
+
+
+def save_std_im_store(std_font: ImageFont.FreeTypeFont, bin_path: str, workers: int = 1):
+    """
+    按黑色比例升序写入 guest range 全部字符的标准图像缓存文件。
+    已有缓存文件可用时保留其中字符，仅渲染缺少的字符并追加。
+    每字符仅渲染一次，黑色比例由图像矩阵求出；workers 大于 1 时并行渲染。
+    """
+    guest_range = sorted({*load_jjwxc_std_guest_range(), *character_list})
+
+    characters: list[str] = []
+    std_bits = np.empty((0, *IMAGE_BITS_SHAPE), dtype=np.uint8)
+    if store.check_store_compatible(bin_path, std_font.path, FONT_SIZE, IMAGE_SIZE, IMAGE_BITS_SHAPE[0]) \
+            and store.verify_store(bin_path):
+        _, std_index, _std_bits, _ = store.load_store(bin_path)
+        characters = list(std_index.keys())
+        std_bits = np.array(_std_bits)
+
+    _characters = set(characters)
+    missing_characters = [x for x in guest_range if x not in _characters]
+    current_app.logger.info('render {} of {} characters'.format(len(missing_characters), len(guest_range)))
+
+    if len(missing_characters) != 0:
+        if workers > 1:
+            missing_bits = render_bits_parallel(std_font.path, missing_characters, workers)
+        else:
+            missing_bits = render_bits(missing_characters, std_font)
+        characters = [*characters, *missing_characters]
+        std_bits = np.concatenate([std_bits, missing_bits])
+
+    std_rates = POPCOUNT_TABLE[std_bits].sum(axis=1) / (IMAGE_SIZE[0] * IMAGE_SIZE[1])
+
+    order = np.argsort(std_rates, kind='stable')
+    store.write_store(
+        bin_path, [characters[i] for i in order], std_bits[order], std_rates[order],
+        FONT_SIZE, IMAGE_SIZE, std_font.path, guest_range
+    )
 
-    with open(josn_path, 'w') as f:
-        json.dump(json_dict, f)
 
+def render_bits(characters: list[str], font: ImageFont.FreeTypeFont) -> np.ndarray:
+    """渲染全部字符，输出 (字符数, 字节数) 图像矩阵"""
+    return np.stack([im_to_bits(draw(x, font)) for x in characters])
+
+
+def match_test_bits(test_bits: np.ndarray, guest_characters: list[str], guest_bits: np.ndarray,
+                    guest_rates: np.ndarray) -> tuple[list[str], list[float], int]:
+    """
+    成批比较全部测试图像与 guest_range 标准图像。
+    输出各测试图像最相似字符、匹配率（共同黑色部分占测试图像比例）及比较次数。
+    """
+    # 按黑色比例排序后分批，同批测试图像需比较的标准图像区间相近
+    test_rates = POPCOUNT_TABLE[test_bits].sum(axis=1) / (IMAGE_SIZE[0] * IMAGE_SIZE[1])
+    order = np.argsort(test_rates, kind='stable')
+
+    most_match_index = np.full(len(test_bits), -1)
+    most_match_rates = np.zeros(len(test_bits))
+    match_times = 0
+    for start in range(0, len(test_bits), MATRIX_CHUNK_SIZE):
+        rows = order[start:start + MATRIX_CHUNK_SIZE]
+        match_rates = match_bits_matrix(test_bits[rows], guest_bits, guest_rates)
+        match_times = match_times + int(np.count_nonzero(~np.isnan(match_rates)))
+        most_match_index[rows], most_match_rates[rows] = get_most_match(match_rates)
+
+    return [guest_characters[i] if i != -1 else '' for i in most_match_index.tolist()], \
+        most_match_rates.tolist(), match_times
+
+
+def match_font_with_confidence(test_font: ImageFont.FreeTypeFont, test_font_characters: list[str],
+                               std_font: ImageFont.FreeTypeFont, guest_range: list[str]) \
+        -> tuple[dict[str, str], dict[str, float]]:
+    """
+    批量匹配字体：一次渲染全部测试字符，仅载入一次标准图像，并成批比较全部测试字符与标准字符。
+    输出匹配结果及各字符匹配率（共同黑色部分占测试图像比例）。
+    """
+    if len(test_font_characters) == 0:
+        return {}, {}
+
+    guest_characters, guest_bits, guest_rates = load_guest_range_matrix(std_font, guest_range)
+    test_bits = render_bits(test_font_characters, test_font)
+
+    most_match_characters, most_match_rates, match_times = match_test_bits(
+        test_bits, guest_characters, guest_bits, guest_rates
+    )
+    g.slow_match_time = g.slow_match_time + match_times
 
-@lru_cache
-def load_std_im_black_point_rates(josn_path: str):
-    with open(josn_path, 'r') as f:
-        return json.load(f)
+    return dict(zip(test_font_characters, most_match_characters)), dict(zip(test_font_characters, most_match_rates))
 
 
 def match_font(test_font: ImageFont.FreeTypeFont, test_font_characters: list[str],
                std_font: ImageFont.FreeTypeFont, guest_range: list[str]):
-    out = {}
-    for test_char in test_font_characters:
-        test_im = draw(test_char, test_font)
-        most_match_char, test_match_result = match_test_im_with_cache(test_im, std_font, guest_range)
-        out[test_char] = most_match_char
-
+    out, _ = match_font_with_confidence(test_font, test_font_characters, std_font, guest_range)
     return out
 
 
 def match_jjwxc_font(jjwxc_font_fd: IO, jjwxc_font_ttf: ttFont.TTFont,
                      std_font=None, guest_range=None):
-    jjwxc_image_font = _load_font(jjwxc_font_fd)
+    jjwxc_image_font = load_test_font(jjwxc_font_fd)
     jjwxc_characters = list(filter(lambda x: x != 'x', list_ttf_characters(jjwxc_font_ttf)))
 
     std_font = std_font or load_SourceHanSansSC_Normal()
@@ -203,15 +327,3 @@ def match_jjwxc_font(jjwxc_font_fd: IO, jjwxc_font_ttf: ttFont.TTFont,
         std_font, guest_range
     )
 
-
-def match_jjwxc_font_one_character(test_character: str, jjwxc_font_fd: IO,
-                                   std_font=None, guest_range=None):
-    jjwxc_image_font = _load_font(jjwxc_font_fd)
-
-    std_font = std_font or load_SourceHanSansSC_Normal()
-    guest_range = guest_range or load_jjwxc_std_guest_range()
-
-    return match_font(
-        jjwxc_image_font, [test_character],
-        std_font, guest_range
-    )
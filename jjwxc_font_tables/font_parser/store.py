@@ -0,0 +1,157 @@
+# 标准图像缓存文件格式
+# 文件依次为：文件头、字符索引（uint32 码位）、黑色比例（float64）、图像矩阵（uint8），
+# 除文件头外各部分均按内存页对齐，可直接以 np.memmap 只读映射。
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+MAGIC = b'JJSTDIM\0'
+VERSION = 2
+PAGE_SIZE = mmap.ALLOCATIONGRANULARITY
+
+# magic, version, 字符数, 每行字节数, 字号, 图像宽, 图像高,
+# 字符索引、黑色比例、图像矩阵偏移, 校验和,
+# 标准字体指纹、文件大小及修改时间, guest range 指纹
+HEADER = struct.Struct('<8sIIIIII QQQ I 20sQQ 20s')
+
+
+class StoreHeader(NamedTuple):
+    magic: bytes
+    version: int
+    count: int
+    row_bytes: int
+    font_size: int
+    image_width: int
+    image_height: int
+    index_offset: int
+    rates_offset: int
+    bits_offset: int
+    checksum: int
+    fingerprint: bytes
+    font_file_size: int
+    font_file_mtime_ns: int
+    guest_range_hash: bytes
+
+
+def _page_align(offset: int) -> int:
+    return -(-offset // PAGE_SIZE) * PAGE_SIZE
+
+
+def get_guest_range_hash(characters) -> bytes:
+    """guest range 指纹，与字符顺序无关"""
+    return hashlib.sha1(''.join(sorted(set(characters))).encode('utf-8')).digest()
+
+
+def get_font_fingerprint(font_path: str) -> bytes:
+    """标准字体文件 sha1"""
+    m = hashlib.sha1()
+    with open(font_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            m.update(chunk)
+    return m.digest()
+
+
+def write_store(path: str, characters: list[str], std_bits: np.ndarray, std_rates: np.ndarray,
+                font_size: int, image_size: tuple[int, int], font_path: str, guest_range=None):
+    """
+    写入标准图像缓存文件，先写入临时文件再替换，避免破坏其他进程已映射的文件。
+    guest_range 为生成该文件所用 guest range ，默认为 characters 。
+    characters 中存在不为单个字符者时抛出 ValueError 。
+    """
+    if any(len(x) != 1 for x in characters):
+        raise ValueError('characters must be single characters')
+    index = np.array([ord(x) for x in characters], dtype=np.uint32)
+    std_rates = np.ascontiguousarray(std_rates, dtype=np.float64)
+    std_bits = np.ascontiguousarray(std_bits, dtype=np.uint8)
+
+    index_offset = PAGE_SIZE
+    rates_offset = _page_align(index_offset + index.nbytes)
+    bits_offset = _page_align(rates_offset + std_rates.nbytes)
+
+    checksum = zlib.crc32(index.tobytes())
+    checksum = zlib.crc32(std_rates.tobytes(), checksum)
+    checksum = zlib.crc32(std_bits.tobytes(), checksum)
+
+    font_stat = os.stat(font_path)
+    header = StoreHeader(
+        MAGIC, VERSION, len(characters), std_bits.shape[1], font_size, *image_size,
+        index_offset, rates_offset, bits_offset, checksum,
+        get_font_fingerprint(font_path), font_stat.st_size, font_stat.st_mtime_ns,
+        get_guest_range_hash(characters if guest_range is None else guest_range)
+    )
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(*header))
+        for offset, array in ((index_offset, index), (rates_offset, std_rates), (bits_offset, std_bits)):
+            f.seek(offset)
+            f.write(array.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def read_header(path: str) -> StoreHeader:
+    """读取文件头，非标准图像缓存文件或版本不一致时抛出 ValueError"""
+    with open(path, 'rb') as f:
+        header = StoreHeader(*HEADER.unpack(f.read(HEADER.size)))
+
+    if header.magic != MAGIC or header.version != VERSION:
+        raise ValueError('unsupported std image store: {}'.format(path))
+    return header
+
+
+def load_store(path: str) -> tuple[StoreHeader, dict[str, int], np.ndarray, np.ndarray]:
+    """以只读 mmap 方式打开标准图像缓存文件，输出文件头、字符行号、图像矩阵及黑色比例"""
+    header = read_header(path)
+
+    index = np.memmap(path, dtype=np.uint32, mode='r', offset=header.index_offset, shape=(header.count,))
+    std_rates = np.memmap(path, dtype=np.float64, mode='r', offset=header.rates_offset, shape=(header.count,))
+    std_bits = np.memmap(path, dtype=np.uint8, mode='r', offset=header.bits_offset,
+                         shape=(header.count, header.row_bytes))
+
+    return header, {chr(x): i for i, x in enumerate(index.tolist())}, std_bits, std_rates
+
+
+def verify_store(path: str) -> bool:
+    """校验标准图像缓存文件完整性"""
+    header, _, std_bits, std_rates = load_store(path)
+    index = np.memmap(path, dtype=np.uint32, mode='r', offset=header.index_offset, shape=(header.count,))
+
+    checksum = zlib.crc32(index)
+    checksum = zlib.crc32(std_rates, checksum)
+    checksum = zlib.crc32(std_bits, checksum)
+    return checksum == header.checksum
+
+
+def check_store_compatible(path: str, font_path: str, font_size: int, image_size: tuple[int, int],
+                           row_bytes: int) -> bool:
+    """
+    仅依据文件头判断标准图像缓存文件中已有字符是否可用：格式版本、渲染参数及标准字体均须一致。
+    标准字体文件大小及修改时间未变时不再重新计算其指纹。
+    """
+    try:
+        header = read_header(path)
+    except (OSError, ValueError, struct.error):
+        return False
+
+    if header.font_size != font_size \
+            or (header.image_width, header.image_height) != tuple(image_size) \
+            or header.row_bytes != row_bytes:
+        return False
+
+    font_stat = os.stat(font_path)
+    if (header.font_file_size, header.font_file_mtime_ns) != (font_stat.st_size, font_stat.st_mtime_ns) \
+            and header.fingerprint != get_font_fingerprint(font_path):
+        return False
+
+    return True
+
+
+def check_store(path: str, font_path: str, guest_range, font_size: int, image_size: tuple[int, int],
+                row_bytes: int) -> bool:
+    """仅依据文件头判断标准图像缓存文件是否可用，除 check_store_compatible 各项外 guest range 亦须一致"""
+    return check_store_compatible(path, font_path, font_size, image_size, row_bytes) \
+        and read_header(path).guest_range_hash == get_guest_range_hash(guest_range)
@@ -1,17 +1,16 @@
 import io
-import tempfile
 from typing import Union
 
 from flask import render_template
-from fontTools.ttLib import ttFont, TTLibError, woff2
+from fontTools.ttLib import ttFont, TTLibError
 from werkzeug.utils import secure_filename
 
 from .commonly_used_character import character_list
-from .download import get_font
+from .download import get_font, decompress_woff2
 from .quick import list_ttf_characters
 from .slow import (
     load_SourceHanSansSC_Normal, load_SourceHanSansSC_Regular, load_jjwxc_std_guest_range, match_jjwxc_font, match_font,
-    _load_font
+    load_test_font
 )
 from ..lib import get_charater_hex
 
@@ -42,7 +41,7 @@ async def match_jjwxc_font_tool(font_name: str, options=None) -> Union[tuple[str
             options.get('guest_range') or "jjwxc"
         ) or load_jjwxc_std_guest_range()
 
-        with io.BytesIO(font.get('bytes')) as font_fd:
+        with io.BytesIO(font.get('ttf_bytes')) as font_fd:
             table = match_jjwxc_font(
                 font_fd, font.get('ttf'),
                 std_font, guest_range
@@ -83,23 +82,16 @@ async def match_upload_font_tool(
         options.get('guest_range') or "jjwxc"
     ) or load_jjwxc_std_guest_range()
 
-    with io.BytesIO(upload_font_bytes) as font_fd:
+    font_fd = io.BytesIO(upload_font_bytes)
+    try:
+        ttf_ttFont = ttFont.TTFont(font_fd)
+    except TTLibError:
         try:
+            font_fd = decompress_woff2(upload_font_bytes)
             ttf_ttFont = ttFont.TTFont(font_fd)
-            font_fd.seek(0)
-            ttf_ImageFont = _load_font(font_fd)
-        except TTLibError:
-            try:
-                with tempfile.TemporaryFile() as tmp:
-                    font_fd.seek(0)
-                    woff2.decompress(font_fd, tmp)
-                    font_fd.seek(0)
-                    tmp.seek(0)
-                    ttf_ttFont = ttFont.TTFont(tmp)
-                    tmp.seek(0)
-                    ttf_ImageFont = _load_font(tmp)
-            except BaseException:
-                return None, 400
+        except BaseException:
+            return None, 400
+    ttf_ImageFont = load_test_font(font_fd)
 
     table = match_font(
         ttf_ImageFont, list_ttf_characters(ttf_ttFont),
@@ -0,0 +1,47 @@
+# coord table 学习日志
+# 每行一个 JSON 条目 [字符, 坐标]，仅追加写入；读取时忽略写入不完整的末行。
+import fcntl
+import json
+import os
+
+
+def append_entries(path: str, entries: list):
+    """追加若干条目，一次写入并 fsync"""
+    data = ''.join(json.dumps(x, ensure_ascii=False) + '\n' for x in entries).encode('utf-8')
+
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # 上次写入中断时末行不完整，另起一行
+        size = os.fstat(fd).st_size
+        if size > 0 and os.pread(fd, 1, size - 1) != b'\n':
+            data = b'\n' + data
+
+        view = memoryview(data)
+        while len(view) != 0:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_entries(path: str, offset: int = 0) -> tuple[list, int]:
+    """自 offset 起读取条目，输出条目及最后一个完整行的结束位置"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    entries = []
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b'\n'):
+            break
+        offset = offset + len(line)
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+
+    return entries, offset
@@ -1,9 +1,15 @@
-import copy
+import fcntl
 import hashlib
 import json
-from functools import lru_cache
+import os
+import threading
+from typing import NamedTuple, Optional
 
-from flask import Response
+import numpy as np
+from flask import Response, current_app
+
+from . import coord_store
+from . import journal
 
 
 def add_etag(response: Response):
@@ -16,61 +22,146 @@ def get_charater_hex(chac: str):
     return str(hex(ord(chac))).replace('0x', 'U+')
 
 
-@lru_cache
+class CoordTable(NamedTuple):
+    """coord table ：编译文件中的字符、坐标起点及坐标数组，以及学习日志中的条目"""
+    characters: list[str]
+    offsets: np.ndarray
+    coords: np.ndarray
+    entries: list
+
+
+# 已载入的 coord table 及其版本：coorTable.json 文件标识、已读取的日志位置、世代
+# coorTable.json 被替换（合并日志、合并远程 coorTable）时世代加一，其他进程据此重新载入
+_coord_table: Optional[CoordTable] = None
+_coord_table_base_key: Optional[tuple] = None
+_coord_table_journal_offset = 0
+_coord_table_generation = 0
+_coord_table_lock = threading.Lock()
+
+
 def load_jjwxc_std_font_coord_table() -> list[
     tuple[
         str,
         list[tuple[int, int]]
     ]
 ]:
-    """载入晋江文学城字体标准coordTable"""
-    from flask import current_app
-
-    with open(current_app.config.get('COORD_TABLE_PATH'), 'r') as f:
-        _t = json.load(f)
-        return sorted(_t, key=lambda x: x[0])
-
+    """载入晋江文学城字体标准coordTable，学习日志中的条目按学习顺序排在最后"""
+    coord_table, _ = load_jjwxc_std_font_coord_table_with_generation()
+    return [
+        *(
+            [character, coord_table.coords[start:end].tolist()]
+            for character, start, end in zip(
+                coord_table.characters, coord_table.offsets[:-1].tolist(), coord_table.offsets[1:].tolist()
+            )
+        ),
+        *coord_table.entries
+    ]
 
-def is_coor_match(x, y) -> bool:
-    """比较 coor"""
 
-    # 如果字符 coor 长度相同
-    if len(x) == len(y):
-        match = True
-        # 逐一比较各点
-        for ii in range(len(x)):
-            rx, ry = x[ii]
-            lx, ly = y[ii]
-            if rx != lx or ry != ly:
-                match = False
-                break
-        return match
-    else:
-        return False
+def _load_coord_store(coord_table_path: str, bin_path: str) -> coord_store.CoordStore:
+    """载入 coorTable.json 对应的编译文件，不存在或已过期时重新编译"""
+    if not coord_store.check_coord_store(bin_path, coord_table_path):
+        with open(coord_table_path, 'r') as f:
+            source_stat = os.fstat(f.fileno())
+            _t = json.load(f)
+        coord_store.write_coord_store(bin_path, sorted(_t, key=lambda x: x[0]), source_stat)
+    return coord_store.load_coord_store(bin_path)
+
+
+def load_jjwxc_std_font_coord_table_with_generation() -> tuple[CoordTable, int]:
+    """
+    载入晋江文学城字体标准coordTable及其世代，coorTable.json 部分以编译文件 mmap 载入，字符无效的条目跳过。
+    每次调用检查文件状态：coorTable.json 变化时重新载入并改变世代，日志增长时仅读取新增条目，
+    其他进程学习的条目因此无需重启即可使用。同一世代内 coord table 仅在末尾追加条目。
+    """
+    global _coord_table, _coord_table_base_key, _coord_table_journal_offset, _coord_table_generation
+
+    coord_table_path = current_app.config.get('COORD_TABLE_PATH')
+    journal_path = current_app.config.get('COORD_TABLE_JOURNAL_PATH')
+
+    with _coord_table_lock:
+        base_stat = os.stat(coord_table_path)
+        base_key = (coord_table_path, journal_path, base_stat.st_ino, base_stat.st_mtime_ns, base_stat.st_size)
+        try:
+            journal_size = os.path.getsize(journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+
+        if _coord_table is None or base_key != _coord_table_base_key or journal_size < _coord_table_journal_offset:
+            base = _load_coord_store(coord_table_path, current_app.config.get('COORD_TABLE_BIN_PATH'))
+            entries, _coord_table_journal_offset = journal.read_entries(journal_path)
+            _coord_table = CoordTable(*base, list(filter(is_valid_coor_entry, entries)))
+            _coord_table_base_key = base_key
+            _coord_table_generation = _coord_table_generation + 1
+        elif journal_size > _coord_table_journal_offset:
+            entries, _coord_table_journal_offset = journal.read_entries(journal_path, _coord_table_journal_offset)
+            _coord_table = _coord_table._replace(
+                entries=[*_coord_table.entries, *filter(is_valid_coor_entry, entries)]
+            )
+
+        return _coord_table, _coord_table_generation
+
+
+def dump_coor_table(path: str, coor_table: list):
+    """写入 coord table ，先写入临时文件再替换，中断时不破坏原文件"""
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(coor_table, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def is_valid_coor_entry(coor_entry) -> bool:
+    """coord table 条目的字符须为单个字符"""
+    character, _ = coor_entry
+    return isinstance(character, str) and len(character) == 1
+
+
+def compact_jjwxc_std_font_coord_table() -> int:
+    """将学习日志合并至 coorTable.json 并清空日志，输出合并的条目数，字符无效的条目丢弃"""
+    with open(current_app.config.get('COORD_TABLE_JOURNAL_PATH'), 'a+b') as journal_file:
+        fcntl.flock(journal_file, fcntl.LOCK_EX)
+        entries, _ = journal.read_entries(current_app.config.get('COORD_TABLE_JOURNAL_PATH'))
+        entries = list(filter(is_valid_coor_entry, entries))
+        if len(entries) != 0:
+            with open(current_app.config.get('COORD_TABLE_PATH'), 'r') as f:
+                coor_table = json.load(f)
+            coor_table = sorted(deduplicate_coor_table([*coor_table, *entries]), key=lambda x: x[0])
+            dump_coor_table(current_app.config.get('COORD_TABLE_PATH'), coor_table)
+        journal_file.truncate(0)
+
+    return len(entries)
+
+
+def learn_jjwxc_std_font_coord_table(entries: list):
+    """记录新学习的 coord table 条目，跳过字符无效的条目，日志超过 COORD_TABLE_JOURNAL_COMPACT_SIZE 时合并"""
+    entries = list(filter(is_valid_coor_entry, entries))
+    if len(entries) == 0:
+        return
+
+    journal_path = current_app.config.get('COORD_TABLE_JOURNAL_PATH')
+    journal.append_entries(journal_path, entries)
+
+    if os.path.getsize(journal_path) > current_app.config.get('COORD_TABLE_JOURNAL_COMPACT_SIZE'):
+        compact_jjwxc_std_font_coord_table()
+
+
+def get_coor_key(coor_entry) -> tuple[str, tuple[tuple[int, int], ...]]:
+    """coord table 条目的可哈希键：字符及坐标元组"""
+    character, coor = coor_entry
+    return character, tuple(map(tuple, coor))
 
 
 def merge_coor_table(source, target):
-    source_copy = copy.copy(source)
-    for j in source:
-        for k in target:
-            if j[0] == k[0] and is_coor_match(j[1], k[1]):
-                source_copy.remove(j)
+    """将 source 中 target 没有的条目合并至 target ，按字符排序"""
+    target_keys = set(map(get_coor_key, target))
+    source_copy = [x for x in source if get_coor_key(x) not in target_keys]
     return sorted([*target, *source_copy], key=lambda x: x[0])
 
 
 def deduplicate_coor_table(source: list):
-    rm_list = []
-    source_length = len(source)
-    for j in range(source_length):
-        for k in range(source_length):
-            if j > k and \
-                    source[j][0] == source[k][0] and is_coor_match(source[j][1], source[k][1]):
-                if k not in rm_list:
-                    rm_list.append(k)
-
-    target = []
-    for index, value in enumerate(source):
-        if index not in rm_list:
-            target.append(value)
-
-    return target
+    """移除重复条目，保留最后出现者，顺序不变"""
+    keys = list(map(get_coor_key, source))
+    last_index = {key: index for index, key in enumerate(keys)}
+    return [value for index, (key, value) in enumerate(zip(keys, source)) if last_index[key] == index]
@@ -2,19 +2,26 @@ import os
 import tempfile
 
 import pytest
+from flask import Flask
 
 from jjwxc_font_tables import create_app
 from jjwxc_font_tables.db import init_db
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     db_path = tempfile.mktemp()
 
+    # 响应缓存、字体锁及 coord table 均使用临时目录，不读写 instance 目录
     app = create_app({
         'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(db_path),
         'TESTING': True,
-        'ENABLE_TOOLS': True
+        'ENABLE_TOOLS': True,
+        'CACHE_DIR': str(tmp_path / 'cache-dir'),
+        'FONT_LOCK_DIR': str(tmp_path / 'locks'),
+        'COORD_TABLE_PATH': str(tmp_path / 'coorTable.json'),
+        'COORD_TABLE_BIN_PATH': str(tmp_path / 'coorTable.bin'),
+        'COORD_TABLE_JOURNAL_PATH': str(tmp_path / 'coorTable.journal')
     })
 
     with app.app_context():
@@ -25,6 +32,19 @@ def app():
     os.unlink(db_path)
 
 
+@pytest.fixture
+def coord_table_app(tmp_path):
+    """仅配置 coord table 路径的应用，不载入标准字体"""
+    app = Flask(__name__)
+    app.config.from_mapping(
+        COORD_TABLE_PATH=str(tmp_path / 'coorTable.json'),
+        COORD_TABLE_BIN_PATH=str(tmp_path / 'coorTable.bin'),
+        COORD_TABLE_JOURNAL_PATH=str(tmp_path / 'coorTable.journal'),
+        COORD_TABLE_JOURNAL_COMPACT_SIZE=1 << 20
+    )
+    return app
+
+
 @pytest.fixture
 def client(app):
     return app.test_client()
@@ -1,6 +1,11 @@
 import hashlib
 
 import pytest
+import sqlalchemy as sa
+from fontTools.ttLib import TTLibError
+
+import jjwxc_font_tables.font_parser as font_parser
+from jjwxc_font_tables.db import db, Font
 
 
 @pytest.mark.parametrize('font_name', (
@@ -119,3 +124,62 @@ def test_get_cors(app, client, path: str):
 ))
 def test_options_cors(app, client, path: str):
     run_cors_test(client.options, path)
+
+
+def test_get_tables(app, client):
+    response = client.get('/api/tables?fonts=jjwxcfont_2o8eo,jjwxcfont_2odzt,jjwxcfont_3o8eo,jjwxcfon_3o8eo')
+    assert response.status_code == 200
+    assert response.headers.get('Content-Type') == 'application/json'
+    assert sorted(response.json['tables'].keys()) == ['jjwxcfont_2o8eo', 'jjwxcfont_2odzt']
+    assert response.json['errors'] == {'jjwxcfont_3o8eo': 404, 'jjwxcfon_3o8eo': 403}
+    assert response.json['tables']['jjwxcfont_2odzt'] == client.get('/api/jjwxcfont_2odzt/table').json
+
+
+def test_post_tables(app, client):
+    response = client.post('/api/tables', json={'fonts': ['jjwxcfont_2o8eo', 'jjwxcfont_2odzt']})
+    assert response.status_code == 200
+    assert sorted(response.json['tables'].keys()) == ['jjwxcfont_2o8eo', 'jjwxcfont_2odzt']
+    assert response.json['errors'] == {}
+    assert response.headers.get('access-control-allow-methods') == 'GET, HEAD, POST, OPTIONS'
+
+
+def test_get_tables_error(app, client, monkeypatch):
+    async def _match_jjwxc_font(font_name: str):
+        if font_name == 'jjwxcfont_2bad0':
+            raise TTLibError('Not a TrueType or OpenType font')
+        return {'name': font_name, 'bytes': b'font', 'hashsum': font_name, 'table': {'一': '二'}}, 200
+
+    monkeypatch.setattr(font_parser, '_match_jjwxc_font', _match_jjwxc_font)
+
+    response = client.get('/api/tables?fonts=jjwxcfont_2bad0,jjwxcfont_2odzt')
+    assert response.status_code == 200
+    assert response.json['tables'] == {'jjwxcfont_2odzt': {'一': '二'}}
+    assert response.json['errors'] == {'jjwxcfont_2bad0': 500}
+    assert response.headers.get('Cache-Control') == 'no-store'
+
+
+@pytest.mark.parametrize('data', (
+        None, [], {'fonts': 'jjwxcfont_2o8eo'}, [1], ['jjwxcfont_2o8eo'] * 100 + ['jjwxcfont_{:05d}'.format(x) for x in range(100)]
+))
+def test_post_tables_400(app, client, data):
+    response = client.post('/api/tables', json=data)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', (
+        '/api/jjwxcfont_2odzt', '/api/jjwxcfont_2odzt/table', '/api/jjwxcfont_2odzt/bytes', '/html/jjwxcfont_2odzt',
+))
+def test_cached_response(app, client, path: str):
+    response = client.get(path)
+    assert response.status_code == 200
+
+    # 命中缓存时不再查询数据库
+    with app.app_context():
+        db.session.execute(sa.delete(Font))
+        db.session.commit()
+
+    cached_response = client.get(path)
+    assert cached_response.status_code == 200
+    assert cached_response.data == response.data
+    assert cached_response.headers.get('ETag') == response.headers.get('ETag')
+    assert cached_response.headers.get('Content-Type') == response.headers.get('Content-Type')
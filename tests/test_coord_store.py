@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from jjwxc_font_tables import coord_store
+
+COORD_TABLE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'jjwxc_font_tables/font_parser/assets/coorTable.json'
+)
+
+
+def test_load_coord_store(tmp_path):
+    path = str(tmp_path / 'coorTable.bin')
+    with open(COORD_TABLE_PATH, 'r') as f:
+        coor_table = json.load(f)
+    coord_store.write_coord_store(path, coor_table, os.stat(COORD_TABLE_PATH))
+
+    characters, offsets, coords = coord_store.load_coord_store(path)
+    assert len(characters) == len(offsets) - 1 == len(coor_table)
+    for character, start, end, (_character, coor) in zip(characters, offsets[:-1], offsets[1:], coor_table):
+        assert character == _character
+        assert coords[start:end].tolist() == coor
+
+    assert coord_store.check_coord_store(path, COORD_TABLE_PATH)
+
+
+def test_check_coord_store(tmp_path):
+    path = str(tmp_path / 'coorTable.bin')
+    source_path = tmp_path / 'coorTable.json'
+    source_path.write_text(json.dumps([['一', [[0, 0], [1, 1]]], ['二', []]]))
+
+    assert not coord_store.check_coord_store(path, str(source_path))
+
+    coord_store.write_coord_store(path, json.loads(source_path.read_text()), os.stat(source_path))
+    assert coord_store.check_coord_store(path, str(source_path))
+    assert coord_store.load_coord_store(path).offsets.tolist() == [0, 2, 2]
+
+    os.utime(source_path, ns=(0, 0))
+    assert not coord_store.check_coord_store(path, str(source_path))
+
+
+def test_read_header_unsupported(tmp_path):
+    path = tmp_path / 'coorTable.bin'
+    path.write_bytes(b'\0' * 1024)
+
+    with pytest.raises(ValueError):
+        coord_store.read_header(str(path))
+
+
+def test_compile_coord_table_invalid_character():
+    characters, offsets, coords = coord_store.compile_coord_table(
+        [['', [[0, 0]]], ['一', [[1, 1]]], ['一二', [[2, 2]]]]
+    )
+
+    assert characters == ['一']
+    assert offsets.tolist() == [0, 1]
+    assert coords.tolist() == [[1, 1]]
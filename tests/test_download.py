@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fontTools.ttLib import ttFont
+
+from jjwxc_font_tables import create_app
+from jjwxc_font_tables.font_parser import download
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+POLICY = download.RetryPolicy(base_delay=0.01, max_delay=0.02, deadline=1, breaker_threshold=2)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    responses = []
+
+    def handler(request: httpx.Request):
+        return responses.pop(0)
+
+    monkeypatch.setattr(download, '_client', httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(download, '_breaker_failures', 0)
+    monkeypatch.setattr(download, '_breaker_open_until', 0.0)
+    return responses
+
+
+def test_retry_policy_from_config(app, monkeypatch):
+    # create_app 中的默认值与 RetryPolicy 一致
+    assert download.RetryPolicy.from_config(app.config) == download.RetryPolicy()
+
+    monkeypatch.setenv('FONT_REQUEST_MAX_ATTEMPTS', '3')
+    monkeypatch.setenv('FONT_REQUEST_RETRY_STATUSES', '429,503')
+    policy = download.RetryPolicy.from_config(create_app({'TESTING': True}).config)
+    assert policy.max_attempts == 3
+    assert policy.retry_statuses == frozenset({429, 503})
+
+
+def test_get_delay():
+    policy = download.RetryPolicy(base_delay=1, multiplier=2, max_delay=5, jitter=0.5)
+    assert 0.5 <= policy.get_delay(0) <= 1
+    assert 2 <= policy.get_delay(2) <= 4
+    assert 2.5 <= policy.get_delay(10) <= 5
+    assert policy.get_delay(0, retry_after=3) == 3
+
+
+def test_parse_retry_after():
+    assert download.parse_retry_after('2') == 2
+    assert download.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert download.parse_retry_after('invalid') is None
+    assert download.parse_retry_after(None) is None
+
+
+def test_request_font_retry(upstream):
+    upstream.extend([httpx.Response(503), httpx.Response(200, content=b'font')])
+    assert asyncio.run(download.request_font('jjwxcfont_2odzt', POLICY)) == (b'font', 'OK')
+
+    upstream.extend([httpx.Response(404)])
+    assert asyncio.run(download.request_font('jjwxcfont_2odzt', POLICY)) == (None, '404')
+
+    # 不可重试的状态码
+    upstream.extend([httpx.Response(403)])
+    assert asyncio.run(download.request_font('jjwxcfont_2odzt', POLICY)) == (None, 'ERROR')
+    assert len(upstream) == 0
+
+
+def test_request_font_circuit_breaker(upstream):
+    upstream.extend([httpx.Response(500)] * POLICY.max_attempts * POLICY.breaker_threshold)
+    for _ in range(POLICY.breaker_threshold):
+        assert asyncio.run(download.request_font('jjwxcfont_2odzt', POLICY)) == (None, 'ERROR')
+    assert download.is_circuit_open()
+
+    upstream.clear()
+    upstream.extend([httpx.Response(200, content=b'font')])
+    assert asyncio.run(download.request_font('jjwxcfont_2odzt', POLICY)) == (None, 'ERROR')
+    assert len(upstream) == 1
+
+
+def test_decompress_woff2():
+    with open(FONT_PATH, 'rb') as f:
+        font_fd = download.decompress_woff2(f.read())
+
+    assert font_fd.tell() == 0
+    assert font_fd.read(4) == b'\0\1\0\0'
+    assert 'glyf' in ttFont.TTFont(font_fd)
@@ -4,3 +4,9 @@ from jjwxc_font_tables import create_app
 def test_config():
     assert not create_app().testing
     assert create_app({'TESTING': True}).testing
+
+
+def test_cache_threshold(app):
+    from jjwxc_font_tables.cache import cache
+    with app.app_context():
+        assert cache.cache._threshold == app.config['CACHE_THRESHOLD']
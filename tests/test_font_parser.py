@@ -0,0 +1,164 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import sqlalchemy as sa
+from fontTools.ttLib import TTLibError, ttFont
+
+import jjwxc_font_tables.font_parser as font_parser
+from jjwxc_font_tables import journal
+from jjwxc_font_tables.db import db, Font
+from jjwxc_font_tables.font_parser import download, pool, quick
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+
+@pytest.fixture
+def matched(monkeypatch):
+    """以计数的假解析替换 _match_jjwxc_font ，jjwxcfont_3 开头的字体不存在"""
+    font_names = []
+
+    async def _match_jjwxc_font(font_name: str):
+        font_names.append(font_name)
+        await asyncio.sleep(0.2)
+        if font_name.startswith('jjwxcfont_3'):
+            return None, 404
+        return {'name': font_name, 'bytes': b'font', 'hashsum': font_name, 'table': {'\ue000': '一'}}, 200
+
+    monkeypatch.setattr(font_parser, '_match_jjwxc_font', _match_jjwxc_font)
+    return font_names
+
+
+async def match_concurrently(font_name: str, times: int):
+    return await asyncio.gather(*(font_parser.match_jjwxc_font(font_name) for _ in range(times)))
+
+
+def test_single_flight(app, matched):
+    with app.app_context():
+        results = asyncio.run(match_concurrently('jjwxcfont_2odzt', 5))
+
+        assert matched == ['jjwxcfont_2odzt']
+        assert [status_code for _, status_code in results] == [200] * 5
+        assert all(font.table == {'\ue000': '一'} for font, _ in results)
+        assert font_parser._in_flight == {}
+
+        assert asyncio.run(match_concurrently('jjwxcfont_3o8eo', 3)) == [(None, 404)] * 3
+        assert matched == ['jjwxcfont_2odzt', 'jjwxcfont_3o8eo']
+
+
+def test_file_lock(app, matched):
+    # 不经过进程内 single-flight ，模拟两个进程同时解析同一字体
+    status_codes = []
+
+    def match():
+        with app.app_context():
+            status_codes.append(asyncio.run(font_parser._match_and_save_font('jjwxcfont_2odzt')))
+
+    threads = [threading.Thread(target=match) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert status_codes == [200, 200]
+    assert matched == ['jjwxcfont_2odzt']
+    with app.app_context():
+        assert db.session.execute(sa.select(sa.func.count(Font.id))).scalar_one() == 1
+
+
+def test_file_lock_stripes(app, matched):
+    app.config['FONT_LOCK_STRIPES'] = 4
+
+    with app.app_context():
+        for i in range(20):
+            asyncio.run(font_parser._match_and_save_font('jjwxcfont_3{:04d}'.format(i)))
+
+    assert len(matched) == 20
+    assert len(os.listdir(app.config['FONT_LOCK_DIR'])) <= 4
+
+
+def test_file_lock_shared_stripe(app, monkeypatch):
+    # 同一进程内两个字体散列至同一锁文件，且仅有一个线程可用（模拟 gevent worker）
+    app.config['FONT_LOCK_STRIPES'] = 1
+    font_names = []
+
+    async def _match_jjwxc_font(font_name: str):
+        font_names.append(font_name)
+        await asyncio.to_thread(time.sleep, 0.2)
+        return {'name': font_name, 'bytes': b'font', 'hashsum': font_name, 'table': {'\ue000': '一'}}, 200
+
+    monkeypatch.setattr(font_parser, '_match_jjwxc_font', _match_jjwxc_font)
+
+    async def match():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        return await asyncio.wait_for(asyncio.gather(
+            font_parser._match_and_save_font('jjwxcfont_2odzt'),
+            font_parser._match_and_save_font('jjwxcfont_2abcd')
+        ), timeout=5)
+
+    with app.app_context():
+        assert asyncio.run(match()) == [200, 200]
+        assert sorted(font_names) == ['jjwxcfont_2abcd', 'jjwxcfont_2odzt']
+        assert db.session.execute(sa.select(sa.func.count(Font.id))).scalar_one() == 2
+
+
+def test_warm_command(app, runner, monkeypatch):
+    with open(FONT_PATH, 'rb') as f:
+        font_bytes = f.read()
+
+    async def get_font(font_name: str):
+        if font_name == 'jjwxcfont_2bad0':
+            raise TTLibError('Not a TrueType or OpenType font')
+        if font_name.startswith('jjwxcfont_3'):
+            return {'status': '404'}
+        return {
+            'name': font_name, 'bytes': font_bytes, 'ttf': ttFont.TTFont(FONT_PATH), 'ttf_bytes': font_bytes,
+            'hashsum': font_name, 'status': 'OK'
+        }
+
+    monkeypatch.setattr(download, 'get_font', get_font)
+
+    result = runner.invoke(args=['fonts', 'warm', '--batch-size', '2'], input='\n'.join([
+        'jjwxcfont_2odzt', 'jjwxcfont_2bad0', 'jjwxcfont_3o8eo', 'jjwxcfont_2odzt', 'invalid'
+    ]))
+
+    assert result.exit_code == 0
+    assert '3 fonts to warm, 0 already exist' in result.output
+    assert 'warmed 1 fonts, 2 failed' in result.output
+    assert 'status 404: 1 fonts' in result.output
+    assert 'status 500: 1 fonts' in result.output
+    with app.app_context():
+        assert db.session.execute(sa.select(Font.name)).scalars().all() == ['jjwxcfont_2odzt']
+
+    result = runner.invoke(args=['fonts', 'warm'], input='jjwxcfont_2odzt\n')
+    assert '0 fonts to warm, 1 already exist' in result.output
+
+
+def test_match_unknown_characters_not_learned(app, monkeypatch):
+    with open(FONT_PATH, 'rb') as f:
+        font_bytes = f.read()
+    characters = sorted(x for x in quick.list_ttf_characters(ttFont.TTFont(FONT_PATH)) if x != 'x')[:2]
+
+    async def get_font(font_name: str):
+        return {
+            'name': font_name, 'bytes': font_bytes, 'ttf': ttFont.TTFont(FONT_PATH), 'ttf_bytes': font_bytes,
+            'hashsum': font_name, 'status': 'OK'
+        }
+
+    async def match_font(_font_bytes: bytes, _characters: list[str]):
+        # 首个字符未匹配到标准字符
+        return {characters[0]: '', characters[1]: '一'}, {}
+
+    monkeypatch.setattr(download, 'get_font', get_font)
+    monkeypatch.setattr(quick, 'match_jjwxc_font', lambda ttf: ({}, characters))
+    monkeypatch.setattr(pool, 'match_font', match_font)
+
+    with app.app_context():
+        font, status_code = asyncio.run(font_parser._match_jjwxc_font('jjwxcfont_2odzt'))
+
+        assert status_code == 200
+        assert font['table'] == {characters[0]: '', characters[1]: '一'}
+        assert [x[0] for x in journal.read_entries(app.config['COORD_TABLE_JOURNAL_PATH'])[0]] == ['一']
@@ -0,0 +1,28 @@
+from jjwxc_font_tables import journal
+
+
+def test_append_and_read_entries(tmp_path):
+    path = str(tmp_path / 'coorTable.journal')
+    assert journal.read_entries(path) == ([], 0)
+
+    journal.append_entries(path, [['一', [[0, 0], [1, 1]]], ['二', [[2, 2]]]])
+    entries, offset = journal.read_entries(path)
+    assert entries == [['一', [[0, 0], [1, 1]]], ['二', [[2, 2]]]]
+
+    journal.append_entries(path, [['三', [[3, 3]]]])
+    assert journal.read_entries(path, offset) == ([['三', [[3, 3]]]], (tmp_path / 'coorTable.journal').stat().st_size)
+
+
+def test_read_entries_truncated(tmp_path):
+    path = tmp_path / 'coorTable.journal'
+    journal.append_entries(str(path), [['一', [[0, 0]]]])
+    size = path.stat().st_size
+
+    # 模拟写入中断
+    with open(path, 'ab') as f:
+        f.write(b'["\\u4e8c", [[2')
+    assert journal.read_entries(str(path)) == ([['一', [[0, 0]]]], size)
+
+    journal.append_entries(str(path), [['三', [[3, 3]]]])
+    entries, _ = journal.read_entries(str(path))
+    assert entries == [['一', [[0, 0]]], ['三', [[3, 3]]]]
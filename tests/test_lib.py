@@ -2,7 +2,11 @@ import copy
 import json
 import os
 
-from jjwxc_font_tables.lib import merge_coor_table, deduplicate_coor_table
+from jjwxc_font_tables import journal
+from jjwxc_font_tables.lib import (
+    merge_coor_table, deduplicate_coor_table, load_jjwxc_std_font_coord_table, learn_jjwxc_std_font_coord_table,
+    compact_jjwxc_std_font_coord_table, dump_coor_table, load_jjwxc_std_font_coord_table_with_generation
+)
 
 
 def test_merge_coor_table(app):
@@ -44,3 +48,57 @@ def test_deduplicate_coor_table(app):
     test2_coor_table = deduplicate_coor_table(test_coor_table)
 
     assert len(test2_coor_table) == len(coor_table)
+
+
+def test_deduplicate_coor_table_keep_last():
+    coor_table = [['一', [[0, 0], [1, 1]]], ['二', [[0, 0]]], ['一', [(0, 0), (1, 1)]], ['一', [[0, 0]]]]
+
+    assert deduplicate_coor_table(coor_table) == coor_table[1:]
+    assert merge_coor_table([['三', [[2, 2]]], ['二', [(0, 0)]]], coor_table[1:]) == [
+        ['一', [(0, 0), (1, 1)]], ['一', [[0, 0]]], ['三', [[2, 2]]], ['二', [[0, 0]]]
+    ]
+
+
+def test_learn_jjwxc_std_font_coord_table(coord_table_app, tmp_path):
+    app = coord_table_app
+    with app.app_context():
+        dump_coor_table(app.config['COORD_TABLE_PATH'], [['二', [[2, 2]]], ['一', [[1, 1]]]])
+
+        _, generation = load_jjwxc_std_font_coord_table_with_generation()
+
+        learn_jjwxc_std_font_coord_table([['三', [[3, 3]]], ['一', [[0, 0]]]])
+        # 仅追加条目时世代不变
+        assert load_jjwxc_std_font_coord_table() == [
+            ['一', [[1, 1]]], ['二', [[2, 2]]], ['三', [[3, 3]]], ['一', [[0, 0]]]
+        ]
+        assert load_jjwxc_std_font_coord_table_with_generation()[1] == generation
+
+        assert compact_jjwxc_std_font_coord_table() == 2
+        assert load_jjwxc_std_font_coord_table_with_generation()[1] != generation
+        assert (tmp_path / 'coorTable.journal').stat().st_size == 0
+        assert load_jjwxc_std_font_coord_table() == [
+            ['一', [[1, 1]]], ['一', [[0, 0]]], ['三', [[3, 3]]], ['二', [[2, 2]]]
+        ]
+
+        app.config['COORD_TABLE_JOURNAL_COMPACT_SIZE'] = 0
+        learn_jjwxc_std_font_coord_table([['四', [[4, 4]]]])
+        assert (tmp_path / 'coorTable.journal').stat().st_size == 0
+        assert load_jjwxc_std_font_coord_table()[-1] == ['四', [[4, 4]]]
+
+
+def test_learn_invalid_character(coord_table_app):
+    app = coord_table_app
+    with app.app_context():
+        dump_coor_table(app.config['COORD_TABLE_PATH'], [['一', [[1, 1]]]])
+
+        # 慢速匹配未找到字符时的结果，及旧版本写入日志的同类条目
+        learn_jjwxc_std_font_coord_table([['', [[2, 2]]], ['二', [[2, 2]]]])
+        journal.append_entries(app.config['COORD_TABLE_JOURNAL_PATH'], [['', [[3, 3]]]])
+        assert load_jjwxc_std_font_coord_table() == [['一', [[1, 1]]], ['二', [[2, 2]]]]
+
+        assert compact_jjwxc_std_font_coord_table() == 1
+        assert load_jjwxc_std_font_coord_table() == [['一', [[1, 1]]], ['二', [[2, 2]]]]
+
+        # coorTable.json 中已有的无效条目不写入编译文件
+        dump_coor_table(app.config['COORD_TABLE_PATH'], [['', [[3, 3]]], ['一', [[1, 1]]]])
+        assert load_jjwxc_std_font_coord_table() == [['一', [[1, 1]]]]
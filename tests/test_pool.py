@@ -0,0 +1,87 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+from flask import Flask, g
+from fontTools.ttLib import ttFont
+
+from jjwxc_font_tables.font_parser import pool, slow, store
+from jjwxc_font_tables.font_parser.quick import list_ttf_characters
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+
+@pytest.fixture
+def pool_app(tmp_path):
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SOURCE_HAN_SANS_SC_NORMAL_PATH=FONT_PATH,
+        SOURCE_HAN_SANS_SC_REGULAR_PATH=FONT_PATH,
+        SOURCE_HAN_SANS_SC_NORMAL_BIN_PATH=str(tmp_path / 'normal.bin'),
+        SOURCE_HAN_SANS_SC_REGULARL_BIN_PATH=str(tmp_path / 'regular.bin'),
+        SLOW_MATCH_WORKERS=1
+    )
+
+    with app.app_context():
+        yield app
+    pool.shutdown()
+
+
+@pytest.fixture
+def characters(pool_app):
+    """以待匹配字体自身作为标准字体写入标准图像缓存，输出其中的字符"""
+    characters = sorted(x for x in list_ttf_characters(ttFont.TTFont(FONT_PATH)) if x != 'x')[:20]
+
+    std_font = slow.load_SourceHanSansSC_Normal()
+    std_bits = slow.render_bits(characters, std_font)
+    std_rates = slow.POPCOUNT_TABLE[std_bits].sum(axis=1) / (slow.IMAGE_SIZE[0] * slow.IMAGE_SIZE[1])
+    order = np.argsort(std_rates, kind='stable')
+    store.write_store(
+        slow.get_std_cache_path(std_font), [characters[i] for i in order], std_bits[order], std_rates[order],
+        slow.FONT_SIZE, slow.IMAGE_SIZE, FONT_PATH
+    )
+    return characters
+
+
+def test_match_font(pool_app, characters):
+    std_font = slow.load_SourceHanSansSC_Normal()
+    with open(FONT_PATH, 'rb') as f:
+        font_bytes = f.read()
+
+    g.slow_match_time = 0
+    table, rates = asyncio.run(pool.match_font(font_bytes, characters, std_font, characters))
+
+    assert pool._executor is not None
+    assert table == {x: x for x in characters}
+    assert rates == {x: 1.0 for x in characters}
+    assert g.slow_match_time > 0
+
+    # 与当前进程中匹配结果一致
+    pool_app.config['SLOW_MATCH_WORKERS'] = 0
+    assert asyncio.run(pool.match_font(font_bytes, characters, std_font, characters)) == (table, rates)
+
+    pool.shutdown()
+    assert pool._executor is None
+
+
+def test_match_font_broken_pool(pool_app, characters):
+    std_font = slow.load_SourceHanSansSC_Normal()
+    with open(FONT_PATH, 'rb') as f:
+        font_bytes = f.read()
+    g.slow_match_time = 0
+
+    # 子进程异常退出
+    executor = pool.get_executor()
+    with pytest.raises(BrokenProcessPool):
+        executor.submit(os._exit, 1).result()
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(pool.match_font(font_bytes, characters, std_font, characters))
+    assert pool._executor is None
+
+    # 下次匹配时重新创建进程池
+    table, _ = asyncio.run(pool.match_font(font_bytes, characters, std_font, characters))
+    assert table == {x: x for x in characters}
+    assert pool._executor is not None and pool._executor is not executor
@@ -0,0 +1,123 @@
+import json
+import os
+
+import numpy as np
+from fontTools.ttLib import ttFont
+
+from jjwxc_font_tables.coord_store import compile_coord_table
+from jjwxc_font_tables.font_parser.download import decompress_woff2
+from jjwxc_font_tables.font_parser.quick import (
+    build_coord_index, build_coord_index_from_arrays, extend_coord_index, is_glpyh_similar, get_font_coor_table,
+    get_character_coor_table_from_font, get_reference_coor_table_from_font, match_similar_characters, normalize_coors,
+    normalize_coord_index, FUZZ
+)
+
+COORD_TABLE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'jjwxc_font_tables/font_parser/assets/coorTable.json'
+)
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+
+def load_coor_table():
+    with open(COORD_TABLE_PATH, 'r') as f:
+        return sorted(json.load(f), key=lambda x: x[0])
+
+
+def test_is_glpyh_similar():
+    a = [(0, 0), (100, 0), (100, 100)]
+    assert is_glpyh_similar(a, [(FUZZ, -FUZZ), (100, 0), (100, 100)], FUZZ)
+    assert not is_glpyh_similar(a, [(FUZZ + 1, 0), (100, 0), (100, 100)], FUZZ)
+    assert not is_glpyh_similar(a, a[:-1], FUZZ)
+    assert is_glpyh_similar([], [], FUZZ)
+
+
+def test_match_similar_characters():
+    coor_table = load_coor_table()
+    index = build_coord_index(coor_table)
+
+    for character, coor in coor_table[::17]:
+        fuzzy_coors = np.array([coor]) + [FUZZ, -FUZZ]
+        assert match_similar_characters(fuzzy_coors, index) == [character]
+
+
+def test_match_similar_characters_not_found():
+    coor_table = load_coor_table()
+    index = build_coord_index(coor_table)
+
+    character, coor = coor_table[0]
+    assert match_similar_characters(np.array([coor]) + [FUZZ + 1, 0], index) == [None]
+    assert match_similar_characters(np.array([coor[:-1]]), index) == [None]
+
+
+def test_get_font_coor_table():
+    with open(FONT_PATH, 'rb') as f:
+        ttf = ttFont.TTFont(decompress_woff2(f.read()), lazy=True)
+
+    cmap = ttf.getBestCmap()
+    coor_table = get_font_coor_table(ttf)
+    assert len(coor_table) == len(cmap)
+
+    for character, coor in coor_table.items():
+        expected = [(int(x), int(y)) for x, y in ttf['glyf'][cmap[ord(character)]].coordinates]
+        assert [tuple(x) for x in coor.tolist()] == expected
+        assert get_character_coor_table_from_font(character, ttf) == expected
+
+
+def test_get_reference_coor_table_from_font():
+    with open(FONT_PATH, 'rb') as f:
+        ttf = ttFont.TTFont(decompress_woff2(f.read()))
+    characters = sorted(get_font_coor_table(ttf).keys())[:5]
+    assert ttf['head'].unitsPerEm == 1000
+
+    reference_coor_table = get_reference_coor_table_from_font(characters, ttf)
+    assert reference_coor_table == {x: get_character_coor_table_from_font(x, ttf) for x in characters}
+
+    # 学习的条目统一缩放至 1000 units per em
+    ttf['head'].unitsPerEm = 2000
+    assert get_reference_coor_table_from_font(characters, ttf) == {
+        character: [tuple(x) for x in np.rint(np.array(coor) / 2).astype(int).tolist()]
+        for character, coor in reference_coor_table.items()
+    }
+
+
+def test_extend_coord_index():
+    coor_table = load_coor_table()
+    index = build_coord_index(coor_table[:200])
+    extended_index = extend_coord_index(index, coor_table[200:])
+    full_index = build_coord_index(coor_table)
+
+    assert extended_index.keys() == full_index.keys()
+    for length, (characters, coors) in full_index.items():
+        assert extended_index[length][0] == characters
+        assert (extended_index[length][1] == coors).all()
+    assert sum(len(x) for x, _ in index.values()) == 200
+
+
+def test_build_coord_index_from_arrays():
+    coor_table = load_coor_table()
+    index = build_coord_index_from_arrays(*compile_coord_table(coor_table))
+    full_index = build_coord_index(coor_table)
+
+    assert index.keys() == full_index.keys()
+    for length, (characters, coors) in full_index.items():
+        assert index[length][0] == characters
+        assert (index[length][1] == coors).all()
+
+
+def test_normalize_coors():
+    coors = np.array([[[100, -50], [300, 150], [200, 50]]])
+    assert normalize_coors(coors).tolist() == [[[0, 0], [200, 200], [100, 100]]]
+    assert normalize_coors(coors * 2, 2000).tolist() == [[[0, 0], [200, 200], [100, 100]]]
+    assert normalize_coors(np.zeros((2, 0, 2))).shape == (2, 0, 2)
+
+
+def test_match_normalized_characters():
+    coor_table = load_coor_table()
+    normalized_index = normalize_coord_index(build_coord_index(coor_table))
+
+    for character, coor in coor_table[::17]:
+        # 平移并缩放至 2048 units per em
+        coors = (np.array([coor]) + [57, -31]) * 2.048
+        assert match_similar_characters(coors, build_coord_index(coor_table)) == [None]
+        assert match_similar_characters(normalize_coors(coors, 2048), normalized_index) == [character]
@@ -0,0 +1,149 @@
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+from fontTools.ttLib import ttFont
+
+from jjwxc_font_tables.font_parser import slow, store
+from jjwxc_font_tables.font_parser.quick import list_ttf_characters
+from jjwxc_font_tables.lib import dump_coor_table
+from jjwxc_font_tables.font_parser.slow import (
+    IMAGE_SIZE, POPCOUNT_TABLE, im_to_bits, count_common_bits, match_bits_matrix, match_test_bits, get_most_match,
+    get_rate_windows, select_guest_range
+)
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+
+def draw_rectangle(xy):
+    image = Image.new("1", IMAGE_SIZE, "white")
+    ImageDraw.Draw(image).rectangle(xy, fill="black")
+    return image
+
+
+def test_im_to_bits():
+    im = draw_rectangle((0, 0, 9, 9))
+    bits = im_to_bits(im)
+    assert bits.dtype == np.uint8
+    assert POPCOUNT_TABLE[bits].sum() == 100
+
+
+def test_match_bits_matrix():
+    ims = [
+        draw_rectangle((10, 10, 59, 59)),
+        draw_rectangle((30, 30, 79, 79)),
+        draw_rectangle((10, 10, 99, 99)),
+    ]
+    bits = np.stack([im_to_bits(x) for x in ims])
+    rates = POPCOUNT_TABLE[bits].sum(axis=1) / (IMAGE_SIZE[0] * IMAGE_SIZE[1])
+
+    match_rates = match_bits_matrix(bits[:2], bits, rates)
+
+    assert match_rates.shape == (2, 3)
+    assert match_rates[0, 0] == 1.0
+    assert match_rates[0, 1] == 30 * 30 / (50 * 50)
+    assert match_rates[1, 0] == 30 * 30 / (50 * 50)
+    # 黑色比例差异超过 20% ，跳过
+    assert np.isnan(match_rates[:, 2]).all()
+
+
+def test_get_most_match():
+    match_rates = np.array([
+        [0.5, 0.9, 0.9],
+        [np.nan, 0.3, np.nan],
+        [np.nan, np.nan, np.nan],
+        [0.0, np.nan, 0.0],
+    ])
+
+    most_match_index, most_match_rates = get_most_match(match_rates)
+
+    assert most_match_index.tolist() == [1, 1, -1, -1]
+    assert most_match_rates.tolist() == [0.9, 0.3, 0.0, 0.0]
+
+
+def test_get_rate_windows():
+    std_rates = np.array([0.05, 0.1, 0.11, 0.12, 0.2, 0.3])
+
+    lo, hi = get_rate_windows(np.array([0.1, 0.25, 0.5]), std_rates)
+
+    assert lo.tolist() == [1, 4, 6]
+    assert hi.tolist() == [4, 6, 6]
+
+
+def test_count_common_bits(monkeypatch):
+    # 每批一个标准图像
+    monkeypatch.setattr(slow, 'MATRIX_CHUNK_SIZE', 1)
+    bits = np.stack([im_to_bits(draw_rectangle((0, 0, x, x))) for x in (9, 19, 29)])
+
+    counts = count_common_bits(bits, bits, np.array([0, 1, 3]), np.array([2, 3, 3]))
+
+    assert counts[0, :2].tolist() == [100, 100]
+    assert counts[1, 1:].tolist() == [400, 400]
+    # 区间外及区间为空的测试图像不比较
+    assert np.isnan(counts[0, 2]) and np.isnan(counts[1, 0]) and np.isnan(counts[2]).all()
+
+
+def test_match_test_bits():
+    ims = [draw_rectangle((10, 10, 10 + x, 10 + x)) for x in (49, 89, 51, 87, 53)]
+    bits = np.stack([im_to_bits(x) for x in ims])
+    rates = POPCOUNT_TABLE[bits].sum(axis=1) / (IMAGE_SIZE[0] * IMAGE_SIZE[1])
+    order = np.argsort(rates)
+
+    # 测试图像按黑色比例排序分批，输出仍按原顺序
+    characters, match_rates, match_times = match_test_bits(
+        bits[::-1], [str(i) for i in order], bits[order], rates[order]
+    )
+
+    assert characters == ['4', '3', '2', '1', '0']
+    assert match_rates == [1.0] * 5
+    assert match_times == int(np.count_nonzero(~np.isnan(match_bits_matrix(bits, bits[order], rates[order]))))
+
+
+def test_select_guest_range():
+    std_bits = np.arange(3 * 8, dtype=np.uint8).reshape(3, 8)
+    std_matrix = ({'一': 0, '乙': 1, '二': 2}, std_bits, np.array([0.1, 0.2, 0.3]))
+
+    characters, bits, rates = select_guest_range(std_matrix, ['二', '', '一', '十'])
+
+    assert characters == ['一', '二']
+    assert (bits == std_bits[[0, 2]]).all()
+    assert rates.tolist() == [0.1, 0.3]
+
+
+def test_save_std_im_store(coord_table_app, tmp_path, monkeypatch):
+    app = coord_table_app
+    bin_path = str(tmp_path / 'std.bin')
+    characters = sorted(x for x in list_ttf_characters(ttFont.TTFont(FONT_PATH)) if x != 'x')[:12]
+
+    rendered = []
+    render_bits = slow.render_bits
+
+    def _render_bits(_characters, font):
+        rendered.extend(_characters)
+        return render_bits(_characters, font)
+
+    monkeypatch.setattr(slow, 'render_bits', _render_bits)
+    monkeypatch.setattr(slow, 'character_list', characters[:8])
+
+    with app.app_context():
+        std_font = slow._load_font(FONT_PATH)
+
+        dump_coor_table(app.config['COORD_TABLE_PATH'], [[x, [[0, 0]]] for x in characters[:10]])
+        slow.save_std_im_store(std_font, bin_path)
+        assert sorted(rendered) == characters[:10]
+        _, std_index, std_bits, _ = store.load_store(bin_path)
+        old_bits = {x: std_bits[i].copy() for x, i in std_index.items()}
+
+        # guest range 增加两个字符，仅渲染新增字符
+        rendered.clear()
+        dump_coor_table(app.config['COORD_TABLE_PATH'], [[x, [[0, 0]]] for x in characters])
+        slow.save_std_im_store(std_font, bin_path)
+        assert sorted(rendered) == characters[10:]
+
+        assert store.verify_store(bin_path)
+        assert store.check_store(bin_path, FONT_PATH, characters, slow.FONT_SIZE, slow.IMAGE_SIZE,
+                                 slow.IMAGE_BITS_SHAPE[0])
+        _, std_index, std_bits, std_rates = store.load_store(bin_path)
+        assert sorted(std_index.keys()) == characters
+        assert all((std_bits[std_index[x]] == bits).all() for x, bits in old_bits.items())
+        assert (np.diff(std_rates) >= 0).all()
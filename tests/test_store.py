@@ -0,0 +1,91 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from jjwxc_font_tables.font_parser import store
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'jjwxcfont_2odzt.woff')
+
+
+def write_test_store(path, font_path=FONT_PATH):
+    characters = ['一', '乙', '二']
+    std_bits = np.arange(3 * 8, dtype=np.uint8).reshape(3, 8)
+    std_rates = np.array([0.1, 0.2, 0.3])
+    store.write_store(path, characters, std_bits, std_rates, 96, (116, 116), font_path)
+    return characters, std_bits, std_rates
+
+
+def test_load_store(tmp_path):
+    path = str(tmp_path / 'test.bin')
+    characters, std_bits, std_rates = write_test_store(path)
+
+    header, std_index, _std_bits, _std_rates = store.load_store(path)
+
+    assert header.count == 3
+    assert header.fingerprint == store.get_font_fingerprint(FONT_PATH)
+    assert header.bits_offset % store.PAGE_SIZE == 0
+    assert std_index == {'一': 0, '乙': 1, '二': 2}
+    assert (_std_bits == std_bits).all()
+    assert (_std_rates == std_rates).all()
+    assert store.verify_store(path)
+
+
+def test_verify_store(tmp_path):
+    path = str(tmp_path / 'test.bin')
+    write_test_store(path)
+
+    header = store.read_header(path)
+    with open(path, 'r+b') as f:
+        f.seek(header.bits_offset + 3)
+        f.write(b'\xff')
+
+    assert not store.verify_store(path)
+
+
+def test_read_header_unsupported(tmp_path):
+    path = tmp_path / 'test.bin'
+    path.write_bytes(b'\0' * 1024)
+
+    with pytest.raises(ValueError):
+        store.read_header(str(path))
+
+
+def test_check_store(tmp_path):
+    path = str(tmp_path / 'test.bin')
+    font_path = str(tmp_path / 'test.woff')
+    shutil.copy(FONT_PATH, font_path)
+    write_test_store(path, font_path)
+
+    assert store.check_store(path, font_path, {'二', '一', '乙'}, 96, (116, 116), 8)
+    assert not store.check_store(path, font_path, {'一', '乙'}, 96, (116, 116), 8)
+    assert not store.check_store(path, font_path, {'二', '一', '乙'}, 72, (87, 87), 8)
+    assert not store.check_store(str(tmp_path / 'missing.bin'), font_path, {'二', '一', '乙'}, 96, (116, 116), 8)
+
+    # 仅修改时间变化，内容不变
+    os.utime(font_path, ns=(0, 0))
+    assert store.check_store(path, font_path, {'二', '一', '乙'}, 96, (116, 116), 8)
+
+    with open(font_path, 'ab') as f:
+        f.write(b'\0')
+    assert not store.check_store(path, font_path, {'二', '一', '乙'}, 96, (116, 116), 8)
+
+
+def test_check_store_compatible(tmp_path):
+    path = str(tmp_path / 'test.bin')
+    characters, std_bits, std_rates = write_test_store(path)
+    store.write_store(path, characters[:2], std_bits[:2], std_rates[:2], 96, (116, 116), FONT_PATH,
+                      guest_range=characters)
+
+    assert store.read_header(path).count == 2
+    assert store.check_store_compatible(path, FONT_PATH, 96, (116, 116), 8)
+    assert store.check_store(path, FONT_PATH, set(characters), 96, (116, 116), 8)
+    assert not store.check_store(path, FONT_PATH, set(characters + ['十']), 96, (116, 116), 8)
+    assert not store.check_store_compatible(path, FONT_PATH, 96, (116, 116), 16)
+
+
+def test_write_store_invalid_character(tmp_path):
+    with pytest.raises(ValueError):
+        store.write_store(str(tmp_path / 'test.bin'), ['一', ''], np.zeros((2, 8), dtype=np.uint8),
+                          np.zeros(2), 96, (116, 116), FONT_PATH)